@@ -1,44 +1,160 @@
-
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
 from urllib.parse import urlparse, parse_qs
 
+YDL_OPTS = {
+    "format": "m4a/bestaudio/best",
+    "quiet": True,
+}
+# Used when the resolved URL carries no `expire` parameter.
+DEFAULT_TTL_SECONDS = int(os.environ.get("AUDIO_URL_TTL_SECONDS", "1800"))
+# Entries are dropped this long before the signed URL expires, so clients get time to use it.
+EXPIRE_MARGIN_SECONDS = int(os.environ.get("AUDIO_URL_EXPIRE_MARGIN_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("AUDIO_URL_CACHE_MAX", "512"))
+# A batch answers in one response, so it must finish within vercel.json's
+# maxDuration (30 s): 16 URLs at 8 concurrent are two waves of extractions.
+MAX_BATCH_URLS = int(os.environ.get("AUDIO_URL_MAX_BATCH", "16"))
+BATCH_CONCURRENCY = int(os.environ.get("AUDIO_URL_BATCH_CONCURRENCY", "8"))
+
+# Module-level state survives between invocations on a warm instance.
+# YoutubeDL is not thread-safe, so each thread keeps its own extractor.
+_local = threading.local()
+_cache = OrderedDict()  # video id -> (expires_at, result)
+_cache_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+
+
+def _ydl():
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = _local.ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+    return ydl
+
+
+def _expires_at(audio_url):
+    """Unix time until which audio_url may be served from the cache."""
+    now = time.time()
+    expire = parse_qs(urlparse(audio_url).query).get("expire")
+    if not expire:
+        # googlevideo sometimes puts parameters in the path: /expire/1700000000/...
+        parts = urlparse(audio_url).path.split("/")
+        if "expire" in parts and parts.index("expire") + 1 < len(parts):
+            expire = [parts[parts.index("expire") + 1]]
+    try:
+        return float(expire[0]) - EXPIRE_MARGIN_SECONDS if expire else now + DEFAULT_TTL_SECONDS
+    except ValueError:
+        return now + DEFAULT_TTL_SECONDS
+
+
+def _video_id(video_url):
+    """YouTube video id of video_url, or the URL itself when none is found."""
+    parsed = urlparse(video_url if "//" in video_url else "//" + video_url)
+    host = (parsed.hostname or "").lower()
+    parts = [p for p in parsed.path.split("/") if p]
+    if host.endswith("youtu.be") and parts:
+        return parts[0]
+    if host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        v = parse_qs(parsed.query).get("v")
+        if v and v[0]:
+            return v[0]
+        if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            return parts[1]
+    return video_url
+
+
+def _cache_get(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(keys, result):
+    expires_at = _expires_at(result["audio_url"])
+    if expires_at <= time.time():
+        return
+    with _cache_lock:
+        for key in keys:
+            _cache[key] = (expires_at, result)
+            _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def resolve(video_url):
+    """Returns ({"audio_url", "title"}, cache_hit)."""
+    video_url = video_url.strip()
+    key = _video_id(video_url)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached, True
+    info = _ydl().extract_info(video_url, download=False)
+    audio_url = info.get("url")
+    if not audio_url:
+        raise ValueError("Could not extract audio URL")
+    result = {"audio_url": audio_url, "title": info.get("title", "Untitled")}
+    _cache_put({key, info.get("id") or key}, result)
+    return result, False
+
+
+def _resolve_entry(video_url):
+    try:
+        result, hit = resolve(video_url)
+        return dict(result, url=video_url, cached=hit)
+    except Exception as e:
+        return {"url": video_url, "error": str(e)}
+
+
 class handler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode("utf-8"))
+
     def do_POST(self):
         content_length = int(self.headers.get("Content-Length", 0))
         body = self.rfile.read(content_length)
         data = json.loads(body)
 
+        urls = data.get("urls")
+        if urls is not None:
+            # Batch form: {"urls": [...]} -> {"results": [...]} in request order;
+            # failures are reported per entry.
+            if not isinstance(urls, list) or not all(isinstance(u, str) and u.strip() for u in urls):
+                self._send_json(400, {"error": "urls must be a list of URLs"})
+                return
+            if len(urls) > MAX_BATCH_URLS:
+                self._send_json(400, {"error": f"At most {MAX_BATCH_URLS} URLs per request"})
+                return
+            # One extraction per video, however many URL forms point at it.
+            by_id = {}
+            for u in urls:
+                by_id.setdefault(_video_id(u.strip()), u.strip())
+            resolved = dict(zip(by_id, _pool.map(_resolve_entry, by_id.values())))
+            self._send_json(200, {"results": [dict(resolved[_video_id(u.strip())], url=u.strip()) for u in urls]})
+            return
+
         video_url = data.get("url")
-        if not video_url:
-            self.send_response(400)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "URL is required"}).encode("utf-8"))
+        if not isinstance(video_url, str) or not video_url.strip():
+            self._send_json(400, {"error": "URL is required"})
             return
 
         try:
-            ydl_opts = {
-                "format": "m4a/bestaudio/best",
-                "quiet": True,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                audio_url = info.get("url")
-                title = info.get("title", "Untitled")
-
-            if audio_url:
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                response = {"audio_url": audio_url, "title": title}
-                self.wfile.write(json.dumps(response).encode("utf-8"))
-            else:
-                raise ValueError("Could not extract audio URL")
-
+            result, hit = resolve(video_url)
+            self._send_json(200, result, {"X-Cache": "HIT" if hit else "MISS"})
         except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8"))
+            self._send_json(500, {"error": str(e)})
@@ -0,0 +1,57 @@
+-- Columns used by the Python worker (run in Supabase SQL editor; idempotent)
+
+-- Job leases: a worker claims a queued job by setting worker_id and
+-- lease_expires_at, and keeps extending the lease while it works.
+alter table public.subtitle_jobs add column if not exists worker_id text;
+alter table public.subtitle_jobs add column if not exists lease_expires_at timestamptz;
+
+-- Share of the audio transcribed so far (0-100), set when STREAM_RESULTS=1.
+alter table public.subtitle_jobs add column if not exists progress numeric;
+-- faster-whisper model:compute_type chosen for the job when STT_TIERS is set.
+alter table public.subtitle_jobs add column if not exists stt_tier text;
+
+create index if not exists subtitle_jobs_status_created_idx
+  on public.subtitle_jobs (status, created_at);
+create index if not exists subtitle_jobs_lease_idx
+  on public.subtitle_jobs (lease_expires_at) where status = 'processing';
+
+-- Upsert keys for the worker's bulk writer (on_conflict=...). Retried chunks
+-- then update existing rows instead of inserting duplicates.
+--
+-- Subtitles are keyed by their position in the transcript (sent_index, the
+-- index subtitle_words.sent_index refers to), not by start: distinct cues
+-- can share a start time.
+alter table public.subtitles add column if not exists sent_index integer;
+drop index if exists public.subtitles_upsert_key;
+
+-- Rows written before the upsert keys existed: re-runs of a job inserted
+-- every cue again. Keep one copy of each identical cue, number the cues of
+-- each video/language in time order, then drop duplicates of the keys.
+delete from public.subtitles a
+  using public.subtitles b
+  where a.sent_index is null and b.sent_index is null
+    and a.video_id = b.video_id and a.lang = b.lang
+    and a.start = b.start and a.text is not distinct from b.text
+    and a.ctid < b.ctid;
+update public.subtitles s
+  set sent_index = n.rn - 1
+  from (
+    select ctid, row_number() over (partition by video_id, lang order by start, ctid) as rn
+    from public.subtitles
+    where sent_index is null
+  ) n
+  where s.ctid = n.ctid;
+delete from public.subtitles a
+  using public.subtitles b
+  where a.video_id = b.video_id and a.lang = b.lang and a.sent_index = b.sent_index
+    and a.ctid < b.ctid;
+delete from public.subtitle_words a
+  using public.subtitle_words b
+  where a.video_id = b.video_id and a.lang = b.lang
+    and a.sent_index = b.sent_index and a.word_index = b.word_index
+    and a.ctid < b.ctid;
+
+create unique index if not exists subtitles_sent_key
+  on public.subtitles (video_id, lang, sent_index);
+create unique index if not exists subtitle_words_upsert_key
+  on public.subtitle_words (video_id, lang, sent_index, word_index);
@@ -3,25 +3,72 @@ import time
 import tempfile
 import subprocess
 import uuid
+import queue
+import shutil
+import socket
+import threading
+import io
+import re
+import html
+import json
+import gzip
+import hashlib
+import sqlite3
+import wave
+import multiprocessing
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from typing import BinaryIO, Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.etree import ElementTree
 
 import requests
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
+try:
+    import numpy as np  # installed with faster-whisper
+except Exception:
+    np = None  # type: ignore
 try:
     # Optional: local/offline STT via faster-whisper
-    from faster_whisper import WhisperModel  # type: ignore
+    from faster_whisper import WhisperModel, decode_audio  # type: ignore
+    from faster_whisper.vad import VadOptions, get_speech_timestamps  # type: ignore
 except Exception:
     WhisperModel = None  # type: ignore
+    decode_audio = None  # type: ignore
+try:
+    from faster_whisper import BatchedInferencePipeline  # type: ignore  # faster-whisper >= 1.1
+except Exception:
+    BatchedInferencePipeline = None  # type: ignore
 try:
     from argostranslate import package as argos_package
     from argostranslate import translate as argos_translate
 except Exception:
     argos_package = None
     argos_translate = None
-import webvtt
+try:
+    import yt_dlp  # type: ignore
+except Exception:
+    yt_dlp = None  # type: ignore
+try:
+    import pyarrow as pa  # type: ignore  # optional: transcript export
+except Exception:
+    pa = None  # type: ignore
+try:
+    from dotenv import load_dotenv  # type: ignore
+except Exception:
+    load_dotenv = None  # type: ignore
 
 # --- Environment ---
+# Machine tuning from `tools/diagnose.py --perf`; variables already set win.
+WORKER_TUNING_FILE = os.environ.get("WORKER_TUNING_FILE",
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env.tuned"))
+if load_dotenv is not None and os.path.isfile(WORKER_TUNING_FILE):
+    load_dotenv(WORKER_TUNING_FILE, override=False)
 SUPABASE_URL = os.environ.get("SUPABASE_URL")  # e.g., https://<project>.supabase.co
 SERVICE_ROLE = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -29,12 +76,119 @@ POLL_INTERVAL_SECONDS = int(os.environ.get("POLL_INTERVAL_SECONDS", "5"))
 DISABLE_STT = os.environ.get("DISABLE_STT", "0") in ("1", "true", "TRUE", "yes", "on")
 MAX_AUDIO_SECONDS_ENV = os.environ.get("MAX_AUDIO_SECONDS")
 MAX_AUDIO_SECONDS = int(MAX_AUDIO_SECONDS_ENV) if MAX_AUDIO_SECONDS_ENV and MAX_AUDIO_SECONDS_ENV.isdigit() else None
+# Speech trimming: STT gets only the VAD speech regions of the audio, and
+# MAX_AUDIO_SECONDS counts speech time. Up to SPEECH_TRIM_ACQUIRE_FACTOR x
+# MAX_AUDIO_SECONDS of wall time is downloaded to find that much speech.
+SPEECH_TRIM = os.environ.get("SPEECH_TRIM", "0") in ("1", "true", "TRUE", "yes", "on")
+SPEECH_TRIM_ACQUIRE_FACTOR = max(1.0, float(os.environ.get("SPEECH_TRIM_ACQUIRE_FACTOR", "4")))
+SPEECH_TRIM_PAD_MS = int(os.environ.get("SPEECH_TRIM_PAD_MS", "200"))
+# Where acquired audio lives: "file" (16 kHz mono WAV in the job's temp dir)
+# or "memory" (raw 16 kHz mono s16le PCM held in the worker).
+AUDIO_SINK = os.environ.get("AUDIO_SINK", "file").lower()
 SINGLE_VIDEO_ID = os.environ.get("VIDEO_ID")
 SINGLE_LANG = os.environ.get("LANG")
 TRANSLATE_ENABLED = os.environ.get("TRANSLATE_ENABLED", "1") in ("1", "true", "TRUE", "yes", "on")
 STORE_SOURCE_LANG = os.environ.get("STORE_SOURCE_LANG", "1") in ("1", "true", "TRUE", "yes", "on")
 TRANSLATE_ENGINE = os.environ.get("TRANSLATE_ENGINE", "argos").lower()
 ARGOS_AUTO_DOWNLOAD = os.environ.get("ARGOS_AUTO_DOWNLOAD", "1") in ("1", "true", "TRUE", "yes", "on")
+TRANSLATION_CACHE_PATH = os.environ.get(
+    "TRANSLATION_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "subtitle-worker", "translations.sqlite3"),
+)
+TRANSLATION_CACHE_MAX_ROWS = int(os.environ.get("TRANSLATION_CACHE_MAX_ROWS", "200000"))  # 0 disables
+OPENAI_TRANSLATE_MODEL = "gpt-4o-mini"
+ARTIFACT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "subtitle-worker", "artifacts"),
+)
+ARTIFACT_CACHE_MAX_MB = int(os.environ.get("ARTIFACT_CACHE_MAX_MB", "2048"))  # 0 disables
+ARTIFACT_CACHE_TTL_HOURS = float(os.environ.get("ARTIFACT_CACHE_TTL_HOURS", "168"))
+CAPTION_DEDUP = os.environ.get("CAPTION_DEDUP", "1") in ("1", "true", "TRUE", "yes", "on")
+FW_CPU_THREADS = int(os.environ.get("FW_CPU_THREADS", "0"))  # 0 = let CTranslate2 decide
+FW_MODEL_CACHE_MB = int(os.environ.get("FW_MODEL_CACHE_MB", "4096"))
+FW_PRELOAD = os.environ.get("FW_PRELOAD", "0") in ("1", "true", "TRUE", "yes", "on")
+# Model tiering: STT_TIERS lists model:compute pairs from best to fastest.
+# Each job gets the best tier that is expected to clear this job plus the
+# queued backlog within STT_LATENCY_SLO_SECONDS; empty uses FW_MODEL for all.
+STT_TIERS = [t.strip() for t in os.environ.get("STT_TIERS", "").split(",") if t.strip()]
+STT_TIER_RTF = os.environ.get("STT_TIER_RTF", "")  # e.g. "small=0.3,base=0.1"
+STT_LATENCY_SLO_SECONDS = float(os.environ.get("STT_LATENCY_SLO_SECONDS", "900"))
+BACKLOG_CACHE_SECONDS = float(os.environ.get("BACKLOG_CACHE_SECONDS", "15"))
+# Language ID: detect the spoken language on the first 30 s with a small
+# model and transcribe in that language (translating to the job language).
+STT_LANGUAGE_ID = os.environ.get("STT_LANGUAGE_ID", "0") in ("1", "true", "TRUE", "yes", "on")
+STT_LANGUAGE_ID_MODEL = os.environ.get("STT_LANGUAGE_ID_MODEL", "tiny")
+STT_LANGUAGE_ID_MIN_PROB = float(os.environ.get("STT_LANGUAGE_ID_MIN_PROB", "0.7"))
+# Queue concurrency: job slots, plus separate limits for I/O-bound (captions,
+# download) and CPU-bound (STT) stages.
+WORKER_CONCURRENCY = max(1, int(os.environ.get("WORKER_CONCURRENCY", "1")))
+IO_CONCURRENCY = max(1, int(os.environ.get("IO_CONCURRENCY", str(WORKER_CONCURRENCY))))
+STT_CONCURRENCY = max(1, int(os.environ.get("STT_CONCURRENCY", "1")))
+JOB_LEASE_SECONDS = max(30, int(os.environ.get("JOB_LEASE_SECONDS", "300")))
+HEARTBEAT_SECONDS = max(5, int(os.environ.get("HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS // 3))))
+CLAIM_CANDIDATES = max(1, int(os.environ.get("CLAIM_CANDIDATES", "5")))
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Claiming a job also claims up to COALESCE_MAX_JOBS-1 other queued jobs for
+# the same video, so captions/STT run once for all of them.
+COALESCE_JOBS = os.environ.get("COALESCE_JOBS", "1") in ("1", "true", "TRUE", "yes", "on")
+COALESCE_MAX_JOBS = max(1, int(os.environ.get("COALESCE_MAX_JOBS", "20")))
+
+# Long-audio mode: audio at least LONG_AUDIO_MIN_SECONDS long is cut at
+# silences into ~LONG_AUDIO_CHUNK_SECONDS chunks transcribed by STT_PROCESSES
+# worker processes with STT_PROCESS_THREADS threads each. Opt-in: every
+# process loads its own model copy, outside the FW_MODEL_CACHE_MB budget.
+LONG_AUDIO_MIN_SECONDS = int(os.environ.get("LONG_AUDIO_MIN_SECONDS", "1200"))
+LONG_AUDIO_CHUNK_SECONDS = max(30, int(os.environ.get("LONG_AUDIO_CHUNK_SECONDS", "300")))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get("CHUNK_OVERLAP_SECONDS", "2"))
+STT_PROCESS_THREADS = max(1, int(os.environ.get("STT_PROCESS_THREADS", str(FW_CPU_THREADS or 2))))
+STT_PROCESSES = max(1, int(os.environ.get("STT_PROCESSES", "1")))
+SAMPLE_RATE = 16000
+
+# STT_MODE=batched: speech clips (<= 30 s, from VAD) are decoded FW_BATCH_SIZE
+# at a time by faster-whisper's BatchedInferencePipeline. With STT_BATCH_JOBS
+# > 1, transcriptions started within STT_BATCH_WAIT_MS of each other (by
+# concurrent transcribe slots, see STT_CONCURRENCY) share one batched call.
+STT_MODE = os.environ.get("STT_MODE", "sequential").lower()
+FW_BATCH_SIZE = max(1, int(os.environ.get("FW_BATCH_SIZE", "8")))
+STT_BATCH_JOBS = max(1, int(os.environ.get("STT_BATCH_JOBS", "1")))
+STT_BATCH_WAIT_MS = int(os.environ.get("STT_BATCH_WAIT_MS", "200"))
+
+# Checkpoints: acquired audio and every finished transcription window are
+# kept under CHECKPOINT_DIR (local disk or a mounted bucket) so a retried or
+# re-leased job resumes where the last attempt stopped. Empty disables.
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "")
+CHECKPOINT_TTL_HOURS = float(os.environ.get("CHECKPOINT_TTL_HOURS", "48"))
+
+# Bulk writes to subtitles/subtitle_words: rows per request, concurrent
+# requests per insert, gzip request bodies and retries per chunk.
+WRITE_CHUNK_ROWS = max(1, int(os.environ.get("WRITE_CHUNK_ROWS", "1000")))
+WRITE_MAX_INFLIGHT = max(1, int(os.environ.get("WRITE_MAX_INFLIGHT", "4")))
+# PostgREST itself does not decode compressed request bodies; enable only
+# behind a proxy that does.
+WRITE_GZIP = os.environ.get("WRITE_GZIP", "0") in ("1", "true", "TRUE", "yes", "on")
+WRITE_RETRIES = max(0, int(os.environ.get("WRITE_RETRIES", "3")))
+
+# Pipeline mode: fetch/audio/transcribe/translate/write run as separate stages
+# joined by bounded queues, so one job downloads while another transcribes.
+# Streaming mode: decoded segments are written in batches while STT runs
+# and subtitle_jobs.progress is updated, instead of inserting at the end.
+STREAM_RESULTS = os.environ.get("STREAM_RESULTS", "0") in ("1", "true", "TRUE", "yes", "on")
+STREAM_FLUSH_SEGMENTS = max(1, int(os.environ.get("STREAM_FLUSH_SEGMENTS", "20")))
+STREAM_FLUSH_SECONDS = float(os.environ.get("STREAM_FLUSH_SECONDS", "5"))
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "0") in ("1", "true", "TRUE", "yes", "on")
+PIPELINE_MAX_JOBS = max(1, int(os.environ.get("PIPELINE_MAX_JOBS", "4")))
+PIPELINE_QUEUE_SIZE = max(1, int(os.environ.get("PIPELINE_QUEUE_SIZE", "1")))
+PIPELINE_TRANSLATE_WORKERS = max(1, int(os.environ.get("PIPELINE_TRANSLATE_WORKERS", "1")))
+PIPELINE_WRITE_WORKERS = max(1, int(os.environ.get("PIPELINE_WRITE_WORKERS", "2")))
+
+# Prometheus-format metrics on http://0.0.0.0:METRICS_PORT/metrics (0 disables).
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# Also write each job's subtitles/words to EXPORT_DIR/<video_id>/ as Parquet or Arrow IPC (needs pyarrow).
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "")
+EXPORT_FORMAT = os.environ.get("EXPORT_FORMAT", "parquet").lower()  # parquet | arrow
+
+_IO_SLOTS = threading.BoundedSemaphore(IO_CONCURRENCY)
+_STT_SLOTS = threading.BoundedSemaphore(STT_CONCURRENCY)
 
 
 def now_utc_iso() -> str:
@@ -54,433 +208,2913 @@ def rest(path: str) -> str:
     return f"{SUPABASE_URL}/rest/v1{path}"
 
 
+_HTTP: Optional[requests.Session] = None
+_HTTP_LOCK = threading.Lock()
+
+
+def http() -> requests.Session:
+    """Process-wide pooled session for all PostgREST calls (keep-alive, one TLS handshake per connection)."""
+    global _HTTP
+    with _HTTP_LOCK:
+        if _HTTP is None:
+            sess = requests.Session()
+            size = WORKER_CONCURRENCY * WRITE_MAX_INFLIGHT + 4
+            sess.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=size))
+            sess.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=size))
+            _HTTP = sess
+        return _HTTP
+
+
+# --- Metrics ---
+_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+_RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._hists: Dict[Tuple[str, Tuple], List] = {}  # key -> [buckets, counts, sum, count]
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple = _SECONDS_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            for i, b in enumerate(h[0]):
+                if value <= b:
+                    h[1][i] += 1
+            h[2] += value
+            h[3] += 1
+
+    @staticmethod
+    def _labels(labels: Tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (h[0], list(h[1]), h[2], h[3]) for k, h in self._hists.items()}
+        for cache, stats in (("translation", TRANSLATION_CACHE.stats()), ("artifact", ARTIFACT_CACHE.stats()),
+                             ("model", MODEL_REGISTRY.stats())):
+            counters[("worker_cache_hits_total", (("cache", cache),))] = stats["hits"]
+            counters[("worker_cache_misses_total", (("cache", cache),))] = stats["misses"]
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), (buckets, counts, total, n) in sorted(hists.items(), key=lambda kv: kv[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for b, c in zip(buckets, counts):
+                le = 'le="%g"' % b
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {c}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{self._labels(labels, le)} {n}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total:g}")
+            lines.append(f"{name}_count{self._labels(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+# Job context of the stage running in this thread; spans add their time to it.
+_CURRENT_JOB = threading.local()
+
+
+class span:
+    """Times a block into worker_span_seconds{span=name} and the current job's timings.
+
+    Spans may nest (e.g. model_load inside stt), so per-job span times do
+    not add up to the job total.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        took = time.perf_counter() - self.t0
+        METRICS.observe("worker_span_seconds", took, span=self.name)
+        ctx = getattr(_CURRENT_JOB, "ctx", None)
+        if ctx is not None:
+            spans = ctx.setdefault("spans", {})
+            spans[self.name] = spans.get(self.name, 0.0) + took
+
+
+def start_metrics_server(port: int) -> None:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://0.0.0.0:{port}/metrics")
+
+
 def fetch_youtube_vtt(video_id: str, lang: str) -> str | None:
     url = f"https://www.youtube.com/api/timedtext?lang={lang}&v={video_id}&fmt=vtt"
-    r = requests.get(url, timeout=15)
+    with span("timedtext"):
+        r = requests.get(url, timeout=15)
     if r.status_code == 200 and r.text.strip():
         return r.text
     return None
 
 
-def parse_vtt_to_items(vtt_text: str) -> List[Dict]:
-    with tempfile.NamedTemporaryFile("w+", suffix=".vtt", delete=False) as f:
-        f.write(vtt_text)
-        f.flush()
-        path = f.name
-    items: List[Dict] = []
-    try:
-        for caption in webvtt.read(path):
-            start_s = _timestamp_to_seconds(caption.start)
-            end_s = _timestamp_to_seconds(caption.end)
-            text = caption.text.strip()
-            if text:
-                items.append({
-                    "start": start_s,
-                    "duration": max(0.0, end_s - start_s),
-                    "text": text,
-                })
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
-    return items
+# --- Caption parsing ---
+# Cue parser for WebVTT, SRT and YouTube JSON3/srv3 that works on str, bytes or
+# a file object without temp files. Cues are yielded lazily as
+# {"start", "duration", "text"} dicts, plus "words" ({"start", "duration",
+# "text"} per word) when the captions carry inline word timings, as YouTube
+# auto captions do.
+CaptionSource = Union[str, bytes, IO]
+_TS_RE = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})")
+_TAG_RE = re.compile(r"<[^>]*>")
+_INLINE_TS_RE = re.compile(r"<((?:\d+:)?\d{1,2}:\d{2}\.\d{3})>")
 
-def split_items_to_words(items: List[Dict]) -> List[Dict]:
-    out: List[Dict] = []
-    for si, it in enumerate(items):
-        text = (it.get("text") or "").strip()
-        if not text:
-            continue
-        words = [w for w in text.split() if w]
-        if not words:
+
+def _iter_text_lines(src: CaptionSource) -> Iterator[str]:
+    if isinstance(src, str):
+        return iter(src.splitlines())
+    if isinstance(src, (bytes, bytearray)):
+        src = io.BytesIO(src)
+    if isinstance(src, io.TextIOBase):
+        return (ln.rstrip("\r\n") for ln in src)
+    return (ln.rstrip("\r\n") for ln in io.TextIOWrapper(src, encoding="utf-8-sig", errors="ignore"))
+
+
+def _clean_cue_text(text: str) -> str:
+    if "<" in text:
+        text = _TAG_RE.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text.strip()
+
+
+def _pieces_to_words(pieces: List[Tuple[float, str]], end: float) -> List[Dict]:
+    """Turn timed text pieces [(start, raw_text), ...] into word dicts.
+
+    Each piece runs until the next piece starts (the last one until end);
+    a piece holding several words is split evenly across its span.
+    """
+    words: List[Dict] = []
+    for i, (p_start, raw) in enumerate(pieces):
+        toks = _clean_cue_text(raw).split()
+        if not toks:
             continue
-        start = float(it.get("start", 0.0))
-        dur = float(it.get("duration", 0.0))
-        step = (dur / len(words)) if dur > 0 and len(words) > 0 else 0.0
-        for wi, w in enumerate(words):
-            w_start = start + step * wi
-            w_dur = max(0.0, step)
-            out.append({
-                "start": w_start,
-                "duration": w_dur,
-                "text": w,
-                "sent_index": si,
-                "word_index": wi,
-            })
-    return out
+        p_end = pieces[i + 1][0] if i + 1 < len(pieces) else end
+        step = max(0.0, p_end - p_start) / len(toks)
+        for k, tok in enumerate(toks):
+            words.append({"start": p_start + step * k, "duration": step, "text": tok})
+    return words
 
 
-def _timestamp_to_seconds(ts: str) -> float:
-    h, m, s = ts.split(":")
-    return int(h) * 3600 + int(m) * 60 + float(s)
+def _cue(start: float, end: float, text: str, pieces: Optional[List[Tuple[float, str]]] = None) -> Optional[Dict]:
+    text = _clean_cue_text(text)
+    if not text:
+        return None
+    cue = {"start": start, "duration": max(0.0, end - start), "text": text}
+    if pieces and len(pieces) > 1:
+        words = _pieces_to_words(pieces, end)
+        if words:
+            cue["words"] = words
+    return cue
 
 
-def download_youtube_audio(video_id: str, out_dir: str) -> str:
-    out_path = os.path.join(out_dir, f"{video_id}-{uuid.uuid4().hex}.wav")
-    cmd = [
-        "yt-dlp",
-        f"https://www.youtube.com/watch?v={video_id}",
-        "-x",
-        "--audio-format",
-        "wav",
-        "-o",
-        out_path,
-    ]
-    subprocess.run(cmd, check=True)
-    return out_path
+def _vtt_pieces(raw: str, start: float) -> Optional[List[Tuple[float, str]]]:
+    """Split `first<00:00:01.234><c> second</c>...` at inline timestamps."""
+    if "<" not in raw:
+        return None
+    parts = _INLINE_TS_RE.split(raw)
+    if len(parts) < 3:
+        return None
+    pieces = [(start, parts[0])]
+    for i in range(1, len(parts), 2):
+        pieces.append((_timestamp_to_seconds(parts[i]), parts[i + 1]))
+    return pieces
 
 
-def download_subtitles_via_ytdlp(video_id: str, lang: str, out_dir: str) -> Optional[str]:
-    """Use yt-dlp to fetch subtitle VTT without downloading video.
-    Returns path to a .vtt file if found, else None.
+def _iter_vtt_srt_cues(lines: Iterable[str]) -> Iterator[Dict]:
+    """WebVTT and SRT share a block layout: optional identifier, a
+    `start --> end` timing line, then text lines up to an empty line. Blocks
+    without a timing line (WEBVTT header, NOTE, STYLE) are skipped.
+
+    Only a truly empty line ends a cue: YouTube auto captions open each
+    caption run with a cue whose first line is a single space.
     """
-    # Try human captions then auto captions
-    for auto in (False, True):
-        cmd = [
-            "yt-dlp",
-            f"https://www.youtube.com/watch?v={video_id}",
-            "--skip-download",
-            "--sub-format", "vtt",
-            "--sub-lang", lang,
-            "-o", os.path.join(out_dir, f"%(id)s.%(ext)s"),
-        ]
-        if auto:
-            cmd.append("--write-auto-sub")
-        else:
-            cmd.append("--write-sub")
-        try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError:
+    timing: Optional[Tuple[float, float]] = None
+    text: List[str] = []
+    for line in lines:
+        if not line:
+            if timing is not None:
+                raw = "\n".join(text)
+                cue = _cue(timing[0], timing[1], raw, _vtt_pieces(raw, timing[0]))
+                if cue:
+                    yield cue
+                timing, text = None, []
             continue
-        # Find produced .vtt
-        for fname in os.listdir(out_dir):
-            if fname.endswith(".vtt") and video_id in fname:
-                return os.path.join(out_dir, fname)
-    return None
+        if timing is None:
+            if "-->" in line:
+                left, _, right = line.partition("-->")
+                right = right.split(None, 1)[0] if right.strip() else ""
+                timing = (_timestamp_to_seconds(left.strip()), _timestamp_to_seconds(right))
+            continue
+        text.append(line)
+    if timing is not None:
+        raw = "\n".join(text)
+        cue = _cue(timing[0], timing[1], raw, _vtt_pieces(raw, timing[0]))
+        if cue:
+            yield cue
 
 
-def clip_audio_if_needed(src_wav: str, out_dir: str) -> str:
-    if not MAX_AUDIO_SECONDS:
-        return src_wav
-    clipped = os.path.join(out_dir, f"clipped-{os.path.basename(src_wav)}")
-    # Resample to 16k mono for faster/cheaper STT
-    cmd = [
-        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-        "-i", src_wav,
-        "-t", str(MAX_AUDIO_SECONDS),
-        "-ac", "1", "-ar", "16000",
-        clipped,
-    ]
-    subprocess.run(cmd, check=True)
-    return clipped
+def _iter_json3_cues(doc: str) -> Iterator[Dict]:
+    for ev in json.loads(doc).get("events") or []:
+        segs = ev.get("segs")
+        if not segs:
+            continue
+        start = ev.get("tStartMs", 0) / 1000.0
+        end = start + ev.get("dDurationMs", 0) / 1000.0
+        pieces = [(start + sg.get("tOffsetMs", 0) / 1000.0, sg.get("utf8", "")) for sg in segs]
+        cue = _cue(start, end, "".join(p for _, p in pieces), pieces)
+        if cue:
+            yield cue
 
 
-def transcribe_with_whisper(audio_path: str, lang: str) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
-    """Unified STT: prefer local faster-whisper unless STT_ENGINE=openai."""
-    if os.environ.get("STT_ENGINE", "faster_whisper").lower() != "openai":
-        if WhisperModel is None:
-            raise RuntimeError("faster-whisper not installed; set STT_ENGINE=openai or install faster-whisper")
-        model_name = os.environ.get("FW_MODEL", "small")
-        device = os.environ.get("FW_DEVICE", "cpu")
-        compute_type = os.environ.get("FW_COMPUTE_TYPE", "int8")
-        print(f"Transcribing with faster-whisper model={model_name} device={device} compute={compute_type} ...")
-        model = WhisperModel(model_name, device=device, compute_type=compute_type)
-        segments, info = model.transcribe(
-            audio_path,
-            language=lang or None,
-            vad_filter=True,
-            word_timestamps=True,
-        )
-        items: List[Dict] = []
-        words_out: List[Dict] = []
-        for seg in segments:
-            txt = (seg.text or '').strip()
-            if not txt:
-                continue
-            s = float(seg.start or 0.0)
-            e = float(seg.end or 0.0)
-            items.append({"start": s, "duration": max(0.0, e - s), "text": txt})
-            for wi, w in enumerate(getattr(seg, 'words', []) or []):
-                wtxt = (getattr(w, 'word', '') or '').strip()
-                if not wtxt:
-                    continue
-                ws = float(getattr(w, 'start', 0.0) or 0.0)
-                we = float(getattr(w, 'end', ws) or ws)
-                words_out.append({
-                    "start": ws,
-                    "duration": max(0.0, we - ws),
-                    "text": wtxt,
-                    "sent_index": getattr(seg, 'id', None),
-                    "word_index": wi,
-                })
-        src = getattr(info, 'language', None)
-        print(f"Transcription done: {len(items)} segments; src_lang={src}")
-        return items, src, (words_out if words_out else None)
+def _iter_srv3_cues(doc: str) -> Iterator[Dict]:
+    for _, el in ElementTree.iterparse(io.StringIO(doc), events=("end",)):
+        if el.tag != "p":
+            continue
+        start = int(el.get("t", "0")) / 1000.0
+        end = start + int(el.get("d", "0")) / 1000.0
+        pieces = [(start, el.text or "")]
+        for s_el in el.findall("s"):
+            pieces.append((start + int(s_el.get("t", "0")) / 1000.0, (s_el.text or "") + (s_el.tail or "")))
+        cue = _cue(start, end, "".join(el.itertext()), pieces)
+        el.clear()
+        if cue:
+            yield cue
 
-    if not OPENAI_API_KEY:
-        raise RuntimeError("Missing OPENAI_API_KEY")
-    timeout = float(os.environ.get("OPENAI_REQUEST_TIMEOUT_SEC", "120"))
-    print(f"Transcribing with Whisper (timeout={timeout}s)...")
-    client = OpenAI(api_key=OPENAI_API_KEY, timeout=timeout)
-    with open(audio_path, "rb") as f:
-        tr = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f,
-                response_format="verbose_json",
-                language=lang if lang else None,
-            )
-    items: List[Dict] = []
-    for seg in tr.segments:
-        start = float(seg.get("start", 0.0))
-        end = float(seg.get("end", start))
-        text = (seg.get("text") or "").strip()
-        if text:
-            items.append({
-                "start": start,
-                "duration": max(0.0, end - start),
-                "text": text,
-            })
-    src_lang = getattr(tr, "language", None)
-    print(f"Transcription done: {len(items)} segments; src_lang={src_lang}")
-    return items, src_lang, None
 
+def iter_caption_cues(src: CaptionSource, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Yield cues from WebVTT/SRT/JSON3/srv3 captions.
 
-def translate_items(items: List[Dict], target_lang: str, source_lang: str | None = None) -> List[Dict]:
-    if TRANSLATE_ENGINE == "openai":
-        if not OPENAI_API_KEY:
-            raise RuntimeError("Missing OPENAI_API_KEY for translation")
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        out: List[Dict] = []
-        chunk_size = 50
-        sys = (
-            f"You are a professional subtitle translator. Translate from {source_lang or 'auto-detected'} to {target_lang}. "
-            "Keep the number of lines the same as the input. Return only the translations, one per line, no numbering."
-        )
-        for i in range(0, len(items), chunk_size):
-            chunk = items[i:i+chunk_size]
-            joined = "\n".join(x["text"].replace("\n", " ") for x in chunk)
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": sys}, {"role": "user", "content": joined}],
-                temperature=0.2,
-            )
-            text = resp.choices[0].message.content or ""
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-            if len(lines) != len(chunk):
-                fixed: List[str] = []
-                for x in chunk:
-                    one = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[{"role": "system", "content": sys}, {"role": "user", "content": x["text"]}],
-                        temperature=0.2,
-                    ).choices[0].message.content or ""
-                    fixed.append(one.strip())
-                lines = fixed
-            for j, ln in enumerate(lines):
-                out.append({"start": chunk[j]["start"], "duration": chunk[j]["duration"], "text": ln})
-        return out
+    fmt is a yt-dlp caption ext ("vtt", "srt", "json3", "srv3"); when omitted
+    the format is sniffed from the first non-blank line.
+    """
+    lines = _iter_text_lines(src)
+    first = ""
+    for first in lines:
+        if first.strip():
+            break
+    first = first.lstrip("\ufeff")
+    if fmt is None:
+        head = first.lstrip()
+        fmt = "json3" if head.startswith("{") else "srv3" if head.startswith("<") else "vtt"
+    lines = chain([first], lines)
+    if fmt == "json3":
+        return _iter_json3_cues("\n".join(lines))
+    if fmt in ("srv3", "srv2", "srv1", "ttml"):
+        return _iter_srv3_cues("\n".join(lines))
+    return _iter_vtt_srt_cues(lines)
 
-    # Argos offline translation
-    if argos_package is None or argos_translate is None:
-        raise RuntimeError("argostranslate is not available; install it or set TRANSLATE_ENGINE=openai")
-    if not source_lang:
-        raise RuntimeError("source_lang is required for Argos translation (use STT-detected language)")
-    # ensure package
-    installed = argos_package.get_installed_packages()
-    if not any(p.from_code == source_lang and p.to_code == target_lang for p in installed):
-        if ARGOS_AUTO_DOWNLOAD:
-            avail = argos_package.get_available_packages()
-            match = next((p for p in avail if p.from_code == source_lang and p.to_code == target_lang), None)
-            if match:
-                path = argos_package.download_package(match)
-                argos_package.install_from_path(path)
-        installed = argos_package.get_installed_packages()
-        if not any(p.from_code == source_lang and p.to_code == target_lang for p in installed):
-            raise RuntimeError(f"Argos language pack not installed for {source_lang}->{target_lang}")
-    translator = argos_translate.get_translation_from_codes(source_lang, target_lang)
+
+def parse_vtt_to_items(vtt_text: CaptionSource, fmt: Optional[str] = None) -> List[Dict]:
+    return list(iter_caption_cues(vtt_text, fmt))
+
+def normalize_caption_items(items: List[Dict]) -> Tuple[List[Dict], int]:
+    """Collapse rolling and overlapping cues into non-overlapping lines.
+
+    YouTube auto captions repeat the previous line at the top of each cue
+    and add short transition cues that only repeat text. Lines repeated from
+    the previous cue are dropped, repeat-only cues extend the previous item,
+    a cue that only grows the previous text by whole words replaces it, and
+    each item is cut where the next one starts. Returns (items, rows_removed).
+    """
     out: List[Dict] = []
+    prev_lines: List[str] = []
     for it in items:
-        out.append({"start": it["start"], "duration": it["duration"], "text": translator.translate(it["text"])})
-    return out
+        lines = [ln.strip() for ln in it["text"].split("\n") if ln.strip()]
+        k = 0
+        for n in range(min(len(prev_lines), len(lines)), 0, -1):
+            if prev_lines[-n:] == lines[:n]:
+                k = n
+                break
+        prev_lines = lines
+        start = it["start"]
+        end = start + it["duration"]
+        last = out[-1] if out else None
+        last_end = last["start"] + last["duration"] if last else 0.0
+        new_lines = lines[k:]
+        if not new_lines:
+            if last is not None and start <= last_end + 0.05:
+                last["duration"] = max(last_end, end) - last["start"]
+            continue
+        text = "\n".join(new_lines)
+        words = it.get("words")
+        if words and k:
+            n_tok = len(text.split())
+            words = [dict(w) for w in words[-n_tok:]] if len(words) >= n_tok else None
+            if words:
+                # The dropped lines shared the first piece; the new line starts with the cue.
+                words[0]["duration"] += words[0]["start"] - start
+                words[0]["start"] = start
+        if last is not None and start <= last_end + 0.05 and text.startswith((last["text"] + " ", last["text"] + "\n")):
+            # Growing caption ("Hello" -> "Hello world", not "Yes" -> "Yesterday"): keep one item.
+            if words and last.get("words"):
+                n_old = len(last["text"].split())
+                words = last["words"] + words[n_old:]
+            last.update({"duration": max(last_end, end) - last["start"], "text": text})
+            if words:
+                last["words"] = words
+            else:
+                last.pop("words", None)
+            continue
+        if last is not None and start < last_end:
+            last["duration"] = max(0.0, start - last["start"])
+        item = {"start": start, "duration": max(0.0, end - start), "text": text}
+        if words:
+            item["words"] = words
+        out.append(item)
+    return out, len(items) - len(out)
 
 
-def get_one_queued_job() -> Dict | None:
-    r = requests.get(
-        rest("/subtitle_jobs"),
-        params={
-            "select": "id,video_id,lang,created_at",
-            "status": "eq.queued",
-            "order": "created_at.asc",
-            "limit": "1",
-        },
-        headers=auth_headers(),
-        timeout=20,
-    )
-    r.raise_for_status()
-    rows = r.json()
-    return rows[0] if rows else None
+def load_caption_items(text: CaptionSource, fmt: Optional[str] = None, is_auto: bool = False) -> List[Dict]:
+    """Parse a caption track; rolling-caption dedup only applies to
+    auto-generated tracks (is_auto)."""
+    items = parse_vtt_to_items(text, fmt)
+    if CAPTION_DEDUP and is_auto and items:
+        n_in = len(items)
+        items, removed = normalize_caption_items(items)
+        print(f"Caption normalization: {n_in} -> {len(items)} cues ({removed} removed)")
+    return items
 
 
-def update_job(job_id: str, status: str, error_message: str | None = None) -> None:
-    body = {"status": status, "updated_at": now_utc_iso()}
-    if error_message:
-        body["error_message"] = error_message[:500]
-    r = requests.patch(
-        rest("/subtitle_jobs"),
-        params={"id": f"eq.{job_id}"},
-        json=body,
-        headers=auth_headers(),
-        timeout=20,
-    )
-    r.raise_for_status()
+# --- Columnar cues ---
+class CueTable:
+    """Cue or word rows as parallel columns instead of one dict per row.
 
+    start/duration are array('d'), sent_index/word_index array('i') with -1
+    for "none" and text a list of str. Iterating yields row dicts for code
+    that still wants them.
+    """
 
-def insert_subtitles(video_id: str, lang: str, items: List[Dict]) -> None:
-    rows = [
-        {
-            "video_id": video_id,
-            "lang": lang,
-            "start": it["start"],
-            "duration": it["duration"],
-            "text": it["text"],
-        }
-        for it in items
-    ]
-    if not rows:
-        return
-    r = requests.post(rest("/subtitles"), json=rows, headers=auth_headers(), timeout=60)
-    r.raise_for_status()
+    __slots__ = ("start", "duration", "text", "sent_index", "word_index")
 
-def insert_subtitle_words(video_id: str, lang: str, words: List[Dict]) -> None:
-    if not words:
-        return
-    rows = [
-        {
-            "video_id": video_id,
-            "lang": lang,
-            "start": w["start"],
-            "duration": w["duration"],
-            "text": w["text"],
-            "sent_index": w.get("sent_index"),
-            "word_index": w.get("word_index"),
+    def __init__(self):
+        self.start = array("d")
+        self.duration = array("d")
+        self.text: List[str] = []
+        self.sent_index = array("i")
+        self.word_index = array("i")
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self.text)):
+            row = {"start": self.start[i], "duration": self.duration[i], "text": self.text[i]}
+            if self.sent_index[i] >= 0:
+                row["sent_index"] = self.sent_index[i]
+                row["word_index"] = self.word_index[i]
+            yield row
+
+    def rows(self) -> List[Dict]:
+        return list(self)
+
+    def append(self, start: float, duration: float, text: str, sent_index: int = -1, word_index: int = -1) -> None:
+        self.start.append(start)
+        self.duration.append(duration)
+        self.text.append(text)
+        self.sent_index.append(sent_index)
+        self.word_index.append(word_index)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "CueTable":
+        if isinstance(rows, CueTable):
+            return rows
+        t = cls()
+        for r in rows:
+            si = r.get("sent_index")
+            wi = r.get("word_index")
+            t.append(float(r["start"]), float(r["duration"]), r["text"],
+                     -1 if si is None else si, -1 if si is None or wi is None else wi)
+        return t
+
+    @classmethod
+    def numbered(cls, items: Iterable[Dict], sent_base: int = 0) -> "CueTable":
+        """Cues of items with sent_index = sent_base + position, the index
+        their word rows refer to."""
+        t = cls.from_rows(items)
+        t.sent_index = array("i", range(sent_base, sent_base + len(t)))
+        return t
+
+    def take(self, indices: List[int]) -> "CueTable":
+        t = CueTable()
+        t.start = array("d", (self.start[i] for i in indices))
+        t.duration = array("d", (self.duration[i] for i in indices))
+        t.text = [self.text[i] for i in indices]
+        t.sent_index = array("i", (self.sent_index[i] for i in indices))
+        t.word_index = array("i", (self.word_index[i] for i in indices))
+        return t
+
+    def rounded(self, column: str, ndigits: int = 3) -> List[float]:
+        values = getattr(self, column)
+        if np is not None and len(values):
+            return np.round(np.frombuffer(values, dtype=np.float64), ndigits).tolist()
+        return [round(v, ndigits) for v in values]
+
+    @classmethod
+    def split_words(cls, items: List[Dict]) -> "CueTable":
+        """Word rows for items; inline caption word timings are used when the
+        parser found them, otherwise each cue's duration is split evenly."""
+        t = cls()
+        start_col, dur_col, text_col, sent_col, word_col = t.start, t.duration, t.text, t.sent_index, t.word_index
+        for si, it in enumerate(items):
+            inline = it.get("words")
+            if inline:
+                for wi, w in enumerate(inline):
+                    start_col.append(w["start"])
+                    dur_col.append(w["duration"])
+                    text_col.append(w["text"])
+                    sent_col.append(si)
+                    word_col.append(wi)
+                continue
+            words = (it.get("text") or "").split()
+            if not words:
+                continue
+            start = float(it.get("start", 0.0))
+            dur = float(it.get("duration", 0.0))
+            step = max(0.0, dur / len(words)) if dur > 0 else 0.0
+            n = len(words)
+            start_col.extend([start + step * wi for wi in range(n)])
+            dur_col.extend([step] * n)
+            text_col.extend(words)
+            sent_col.extend([si] * n)
+            word_col.extend(range(n))
+        return t
+
+    @classmethod
+    def project_translated(cls, t_items: List[Dict], sent_base: int = 0) -> "CueTable":
+        """Word rows for translated items without translating words one by one.
+
+        Each translated sentence is tokenized and its tokens spread across the
+        sentence's time span in proportion to their length. sent_index starts
+        at sent_base.
+        """
+        t = cls()
+        for si, it in enumerate(t_items, start=sent_base):
+            toks = tokenize_translated(it.get("text") or "")
+            if not toks:
+                continue
+            start = float(it.get("start", 0.0))
+            dur = float(it.get("duration", 0.0))
+            total = sum(len(tok) for tok in toks)
+            pos = start
+            for wi, tok in enumerate(toks):
+                w_dur = dur * len(tok) / total if total else 0.0
+                t.append(pos, w_dur, tok, si, wi)
+                pos += w_dur
+        return t
+
+    def json_chunks(self, video_id: str, lang: str, chunk_rows: int, word_rows: bool) -> Iterator[Tuple[bytes, int]]:
+        """PostgREST insert bodies of up to chunk_rows rows, as (payload, n_rows).
+
+        Rows carry sent_index, plus word_index for word rows. They are
+        formatted straight from the columns; the bytes equal json.dumps of
+        the equivalent row dicts.
+        """
+        prefix = '{"video_id":%s,"lang":%s,' % (json.dumps(video_id, ensure_ascii=False),
+                                                 json.dumps(lang, ensure_ascii=False))
+        starts, durs = self.rounded("start"), self.rounded("duration")
+        dumps = json.dumps
+        for lo in range(0, len(self.text), chunk_rows):
+            hi = min(lo + chunk_rows, len(self.text))
+            if word_rows:
+                parts = [
+                    '%s"start":%r,"duration":%r,"text":%s,"sent_index":%s,"word_index":%s}' % (
+                        prefix, starts[i], durs[i], dumps(self.text[i], ensure_ascii=False),
+                        self.sent_index[i] if self.sent_index[i] >= 0 else "null",
+                        self.word_index[i] if self.sent_index[i] >= 0 else "null")
+                    for i in range(lo, hi)
+                ]
+            else:
+                parts = [
+                    '%s"start":%r,"duration":%r,"text":%s,"sent_index":%s}' % (
+                        prefix, starts[i], durs[i], dumps(self.text[i], ensure_ascii=False),
+                        self.sent_index[i] if self.sent_index[i] >= 0 else "null")
+                    for i in range(lo, hi)
+                ]
+            yield ("[" + ",".join(parts) + "]").encode("utf-8"), hi - lo
+
+    def to_arrow(self, video_id: str, lang: str):
+        n = len(self.text)
+        cols = {
+            "video_id": pa.array([video_id] * n, pa.string()),
+            "lang": pa.array([lang] * n, pa.string()),
+            "start": pa.array(np.frombuffer(self.start, dtype=np.float64) if np is not None else list(self.start), pa.float64()),
+            "duration": pa.array(np.frombuffer(self.duration, dtype=np.float64) if np is not None else list(self.duration),
+                                 pa.float64()),
+            "text": pa.array(self.text, pa.string()),
         }
-        for w in words
+        if any(i >= 0 for i in self.sent_index):
+            cols["sent_index"] = pa.array([i if i >= 0 else None for i in self.sent_index], pa.int32())
+        if any(i >= 0 for i in self.word_index):
+            cols["word_index"] = pa.array([w if s >= 0 else None for s, w in zip(self.sent_index, self.word_index)],
+                                          pa.int32())
+        return pa.table(cols)
+
+
+def split_items_to_words(items: List[Dict]) -> List[Dict]:
+    """Word rows for items as dicts (see CueTable.split_words)."""
+    return CueTable.split_words(items).rows()
+
+
+def _timestamp_to_seconds(ts: str) -> float:
+    """HH:MM:SS.mmm or MM:SS.mmm (',' accepted for SRT)."""
+    m = _TS_RE.match(ts)
+    if not m:
+        raise ValueError(f"Bad caption timestamp: {ts!r}")
+    h, mi, sec, frac = m.groups()
+    return (int(h) * 3600 if h else 0) + int(mi) * 60 + int(sec) + int(frac) / (10 ** len(frac))
+
+
+# Audio handed to STT: path to a 16 kHz mono WAV, raw 16 kHz mono s16le PCM
+# bytes, or a readable stream of the same PCM (e.g. an ffmpeg stdout pipe).
+AudioSource = Union[str, bytes, BinaryIO]
+
+
+def _stream_youtube_audio(video_id: str, out_args: List[str], max_seconds: Optional[int],
+                          capture: bool = False, info: Optional[Dict] = None) -> Optional[bytes]:
+    """Decode the best audio stream to 16 kHz mono with ffmpeg.
+
+    With an already extracted info dict ffmpeg reads the selected format's
+    URL directly; otherwise yt-dlp is piped into ffmpeg. Either way ffmpeg
+    exits once max_seconds of output are written, so only the needed prefix
+    is downloaded.
+    """
+    out_opts = (["-t", str(max_seconds)] if max_seconds else []) + ["-ac", "1", "-ar", str(SAMPLE_RATE)] + out_args
+    if info and info.get("url"):
+        headers = "".join(f"{k}: {v}\r\n" for k, v in (info.get("http_headers") or {}).items())
+        ff_cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostdin",
+                  "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+        if headers:
+            ff_cmd += ["-headers", headers]
+        ff_cmd += ["-i", info["url"], "-vn"] + out_opts
+        res = subprocess.run(ff_cmd, check=True, stdout=subprocess.PIPE if capture else subprocess.DEVNULL)
+        return res.stdout
+    yt_cmd = [
+        "yt-dlp", "-q", "--no-warnings",
+        "-f", "bestaudio/best",
+        "-o", "-",
+        f"https://www.youtube.com/watch?v={video_id}",
     ]
-    r = requests.post(rest("/subtitle_words"), json=rows, headers=auth_headers(), timeout=60)
-    r.raise_for_status()
+    ff_cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-vn"] + out_opts
+    yt = subprocess.Popen(yt_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        ff = subprocess.Popen(ff_cmd, stdin=yt.stdout, stdout=subprocess.PIPE if capture else subprocess.DEVNULL)
+        yt.stdout.close()  # ffmpeg owns the read end; yt-dlp gets SIGPIPE when it exits
+        data, _ = ff.communicate()
+    finally:
+        if yt.poll() is None:
+            yt.terminate()
+        yt_rc = yt.wait()
+    if ff.returncode != 0:
+        if yt_rc not in (0, -15):
+            raise subprocess.CalledProcessError(yt_rc, yt_cmd)
+        raise subprocess.CalledProcessError(ff.returncode, ff_cmd)
+    return data
 
 
-def process_one_job() -> bool:
-    job = get_one_queued_job()
-    if not job:
-        return False
-    job_id = job["id"]
-    video_id = job["video_id"]
-    lang = job["lang"]
-    print(f"Processing job {job_id} {video_id} {lang}")
-    update_job(job_id, "processing")
+def download_youtube_audio(video_id: str, out_dir: str, max_seconds: Optional[int] = MAX_AUDIO_SECONDS,
+                           info: Optional[Dict] = None) -> str:
+    out_path = os.path.join(out_dir, f"{video_id}-{uuid.uuid4().hex}.wav")
+    _stream_youtube_audio(video_id, ["-c:a", "pcm_s16le", "-f", "wav", out_path], max_seconds, info=info)
+    return out_path
+
+
+def fetch_youtube_audio_pcm(video_id: str, max_seconds: Optional[int] = MAX_AUDIO_SECONDS,
+                            info: Optional[Dict] = None) -> bytes:
+    return _stream_youtube_audio(video_id, ["-f", "s16le", "pipe:1"], max_seconds, capture=True, info=info) or b""
+
+
+def acquire_seconds() -> Optional[int]:
+    """Wall-clock audio to acquire: MAX_AUDIO_SECONDS, widened when speech trimming applies the budget to speech."""
+    if SPEECH_TRIM and MAX_AUDIO_SECONDS:
+        return int(MAX_AUDIO_SECONDS * SPEECH_TRIM_ACQUIRE_FACTOR)
+    return MAX_AUDIO_SECONDS
+
+
+def acquire_audio(video_id: str, out_dir: str, info: Optional[Dict] = None) -> AudioSource:
+    with span("ffmpeg_audio"):
+        if AUDIO_SINK == "memory":
+            return fetch_youtube_audio_pcm(video_id, max_seconds=acquire_seconds(), info=info)
+        return download_youtube_audio(video_id, out_dir, max_seconds=acquire_seconds(), info=info)
+
+
+def audio_to_array(audio: AudioSource):
+    """Decode any AudioSource to float32 samples at 16 kHz."""
+    if isinstance(audio, str):
+        return decode_audio(audio, sampling_rate=SAMPLE_RATE)
+    if hasattr(audio, "read"):
+        audio = audio.read()
+    return np.frombuffer(audio, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def audio_to_pcm(audio: AudioSource) -> bytes:
+    """16 kHz mono s16le bytes for any AudioSource (WAV files as written by ffmpeg)."""
+    if isinstance(audio, str):
+        with wave.open(audio, "rb") as w:
+            return w.readframes(w.getnframes())
+    return audio.read() if hasattr(audio, "read") else audio
+
+
+def array_to_pcm(samples) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def pcm_to_wav_bytes(pcm: bytes) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+
+# One YoutubeDL per thread: instances are reused across jobs but not shared
+# between concurrent slots.
+_YDL_LOCAL = threading.local()
+CAPTION_EXTS = ("vtt", "json3", "srv3", "srt")
+
+
+def _ydl():
+    ydl = getattr(_YDL_LOCAL, "ydl", None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL({
+            "quiet": True,
+            "no_warnings": True,
+            "skip_download": True,
+            "noplaylist": True,
+            "format": "bestaudio/best",
+        })
+        _YDL_LOCAL.ydl = ydl
+    return ydl
+
+
+def extract_video_info(video_id: str) -> Optional[Dict]:
+    """Resolve the watch page once; the result lists caption tracks and the
+    selected audio format, and is reused by both the caption and audio paths."""
+    if yt_dlp is None:
+        return None
     try:
-        items: List[Dict] = []
-        # Prefer yt-dlp subtitle fetch for better compatibility
-        with tempfile.TemporaryDirectory() as tmp_sub:
-            vtt_path = download_subtitles_via_ytdlp(video_id, lang, tmp_sub)
-            if vtt_path and os.path.exists(vtt_path):
-                print("Subtitles via yt-dlp found. Parsing VTT...")
-                with open(vtt_path, "r", encoding="utf-8", errors="ignore") as f:
-                    vtt_text = f.read()
-                items = parse_vtt_to_items(vtt_text)
-
-        if not items:
-            print("Trying public CC (timedtext)...")
-            vtt = fetch_youtube_vtt(video_id, lang)
-            if vtt:
-                print("CC via timedtext. Parsing VTT...")
-                items = parse_vtt_to_items(vtt)
-        src_lang: str | None = None
-        words: Optional[List[Dict]] = None
-        if not items:
-            if DISABLE_STT:
-                raise RuntimeError("No CC and STT is disabled (set DISABLE_STT=0 to enable)")
-            print("No CC or empty. Falling back to STT (yt-dlp + Whisper)...")
-            with tempfile.TemporaryDirectory() as tmp:
-                wav = download_youtube_audio(video_id, tmp)
-                wav2 = clip_audio_if_needed(wav, tmp)
-                items, src_lang, words = transcribe_with_whisper(wav2, lang)
-        if not items:
-            raise RuntimeError("No subtitles from CC nor STT")
-        if words is None:
-            words = split_items_to_words(items)
-        # If we transcribed in another language, translate to requested
-        if TRANSLATE_ENABLED and src_lang and src_lang.lower() != lang.lower():
-            t_items = translate_items(items, target_lang=lang, source_lang=src_lang)
-            insert_subtitles(video_id, lang, t_items)
-            t_words = translate_items(words or [], target_lang=lang, source_lang=src_lang) if words else []
-            insert_subtitle_words(video_id, lang, t_words)
-            if STORE_SOURCE_LANG:
-                insert_subtitles(video_id, src_lang, items)
-                insert_subtitle_words(video_id, src_lang, words or [])
-        else:
-            insert_subtitles(video_id, lang, items)
-            insert_subtitle_words(video_id, lang, words or [])
-        update_job(job_id, "done")
-        print(f"Job done: {len(items)} items")
+        with span("ytdlp_info"):
+            return _ydl().extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
     except Exception as e:
-        update_job(job_id, "error", str(e))
-        print(f"Job error: {e}")
-    return True
+        print(f"yt-dlp extract_info failed: {e}")
+        return None
 
 
-def process_single(video_id: str, lang: str) -> None:
-    print(f"Single-shot: {video_id} {lang}")
+def pick_caption_track(info: Dict, lang: str) -> Optional[Tuple[Dict, bool]]:
+    """Best (format, is_auto) for lang: manual subtitles before automatic
+    captions, exact language code before regional variants (en-US, en-orig)."""
+    for auto, key in ((False, "subtitles"), (True, "automatic_captions")):
+        tracks = info.get(key) or {}
+        codes = [lang] + sorted(c for c in tracks if c != lang and c.split("-")[0] == lang)
+        for code in codes:
+            fmts = tracks.get(code) or []
+            for ext in CAPTION_EXTS:
+                for fmt in fmts:
+                    if fmt.get("ext") == ext and fmt.get("url"):
+                        return fmt, auto
+    return None
+
+
+def fetch_captions_via_ytdlp(info: Optional[Dict], lang: str) -> Optional[Tuple[str, str, bool]]:
+    """Download the best caption track for lang into memory as (text, ext,
+    is_auto); None when there is none or the download fails."""
+    if not info:
+        return None
+    track = pick_caption_track(info, lang)
+    if not track:
+        return None
+    fmt, auto = track
     try:
-        items: List[Dict] = []
-        src_lang: str | None = None
-        words: Optional[List[Dict]] = None
-        with tempfile.TemporaryDirectory() as tmp:
-            vtt_path = download_subtitles_via_ytdlp(video_id, lang, tmp)
-            if vtt_path and os.path.exists(vtt_path):
-                with open(vtt_path, "r", encoding="utf-8", errors="ignore") as f:
-                    items = parse_vtt_to_items(f.read())
-        if not items:
-            vtt = fetch_youtube_vtt(video_id, lang)
-            if vtt:
-                items = parse_vtt_to_items(vtt)
-        if not items and not DISABLE_STT:
-            with tempfile.TemporaryDirectory() as tmp:
-                wav = download_youtube_audio(video_id, tmp)
-                wav2 = clip_audio_if_needed(wav, tmp)
-                items, src_lang, words = transcribe_with_whisper(wav2, lang)
-        if not items:
-            raise RuntimeError("No subtitles available (CC and STT disabled or failed)")
-        # Ensure words
-        if words is None:
-            words = split_items_to_words(items)
-        # Align with queue processing: translate if STT detected a different language
-        if TRANSLATE_ENABLED and src_lang and src_lang.lower() != lang.lower():
-            t_items = translate_items(items, target_lang=lang, source_lang=src_lang)
-            insert_subtitles(video_id, lang, t_items)
-            t_words = translate_items(words or [], target_lang=lang, source_lang=src_lang) if words else []
-            insert_subtitle_words(video_id, lang, t_words)
-            if STORE_SOURCE_LANG:
-                insert_subtitles(video_id, src_lang, items)
-                insert_subtitle_words(video_id, src_lang, words or [])
-        else:
-            insert_subtitles(video_id, lang, items)
-            insert_subtitle_words(video_id, lang, words or [])
-        print(f"Single-shot done: {len(items)} items")
+        with span("ytdlp_captions"):
+            resp = _ydl().urlopen(fmt["url"])
+            try:
+                data = resp.read()
+            finally:
+                resp.close()
     except Exception as e:
-        print(f"Single-shot error: {e}")
+        # e.g. HTTP 429 on the timedtext URL: fall through to timedtext/STT
+        print(f"yt-dlp caption download failed: {e}")
+        return None
+    print(f"Captions via yt-dlp: {'auto' if auto else 'manual'} {fmt.get('ext')} ({len(data)} bytes)")
+    return data.decode("utf-8", errors="ignore"), fmt["ext"], auto
 
 
-def main():
-    if not SUPABASE_URL or not SERVICE_ROLE:
-        raise RuntimeError("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
-    if SINGLE_VIDEO_ID and SINGLE_LANG:
-        print("Worker started (single-shot mode)")
-        process_single(SINGLE_VIDEO_ID, SINGLE_LANG)
-        return
-    print("Worker started (REST mode)")
+# --- faster-whisper model registry ---
+# Approximate resident size (MB) of float16 weights; int8 roughly halves it.
+_FW_MODEL_SIZE_MB = {
+    "tiny": 75,
+    "base": 145,
+    "small": 490,
+    "medium": 1530,
+    "large-v1": 3090,
+    "large-v2": 3090,
+    "large-v3": 3090,
+    "distil-large-v3": 1510,
+}
+
+
+def _estimate_model_mb(model_name: str, compute_type: str) -> int:
+    name = os.path.basename(model_name.rstrip("/")).split(".")[0]
+    size = _FW_MODEL_SIZE_MB.get(name, 1000)
+    if compute_type.startswith("int8"):
+        size //= 2
+    elif compute_type == "float32":
+        size *= 2
+    return size
+
+
+_TIER_LOCAL = threading.local()
+
+
+def fw_settings() -> Tuple[str, str, str, int]:
+    """(model, device, compute_type, cpu_threads) from the environment, or
+    from the tier selected for the current thread's job (use_stt_tier)."""
+    tier = getattr(_TIER_LOCAL, "tier", None)
+    return (
+        tier[0] if tier else os.environ.get("FW_MODEL", "small"),
+        os.environ.get("FW_DEVICE", "cpu"),
+        tier[1] if tier else os.environ.get("FW_COMPUTE_TYPE", "int8"),
+        FW_CPU_THREADS,
+    )
+
+
+class use_stt_tier:
+    """Context manager: fw_settings() returns tier's model/compute in this thread."""
+
+    def __init__(self, tier: Optional[Tuple[str, str]]):
+        self.tier = tier
+
+    def __enter__(self) -> None:
+        self._prev = getattr(_TIER_LOCAL, "tier", None)
+        _TIER_LOCAL.tier = self.tier or self._prev
+
+    def __exit__(self, *exc) -> None:
+        _TIER_LOCAL.tier = self._prev
+
+
+class WhisperModelRegistry:
+    """Keeps loaded WhisperModel instances warm across jobs.
+
+    Models are loaded lazily on first use and evicted least-recently-used
+    once the estimated total size exceeds budget_mb. Loads run outside the
+    registry lock: callers wanting a model that is being loaded wait for
+    that load only, and warm models stay available meanwhile.
+    """
+
+    def __init__(self, budget_mb: int):
+        self.budget_mb = budget_mb
+        self._models: "OrderedDict[Tuple[str, str, str, int], Tuple[object, int]]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str, str, int], Tuple[Future, int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def get(self, model_name: str, device: str, compute_type: str, cpu_threads: int = 0):
+        if WhisperModel is None:
+            raise RuntimeError("faster-whisper not installed; set STT_ENGINE=openai or install faster-whisper")
+        key = (model_name, device, compute_type, cpu_threads)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            loading = self._loading.get(key)
+            if loading is None:
+                self.misses += 1
+                size_mb = _estimate_model_mb(model_name, compute_type)
+                self._evict_for(size_mb)
+                fut: Future = Future()
+                self._loading[key] = (fut, size_mb)
+            else:
+                self.hits += 1
+        if loading is not None:
+            return loading[0].result()
+        t0 = time.perf_counter()
+        try:
+            with span("model_load"):
+                model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            fut.set_exception(e)
+            raise
+        took = time.perf_counter() - t0
+        with self._lock:
+            del self._loading[key]
+            self.load_seconds += took
+            self._models[key] = (model, size_mb)
+        fut.set_result(model)
+        print(f"Loaded faster-whisper model={model_name} device={device} compute={compute_type} "
+              f"threads={cpu_threads or 'auto'} in {took:.2f}s (hits={self.hits} misses={self.misses})")
+        return model
+
+    def _evict_for(self, size_mb: int) -> None:
+        """Called with the lock held; models still loading count against the budget."""
+        used = sum(sz for _, sz in self._models.values()) + sum(sz for _, sz in self._loading.values())
+        while self._models and used + size_mb > self.budget_mb:
+            key, (_, sz) = self._models.popitem(last=False)
+            used -= sz
+            self.evictions += 1
+            print(f"Evicted faster-whisper model {key[0]}/{key[2]} ({sz} MB)")
+
+    def preload(self) -> None:
+        """Load the configured model, or every STT_TIERS model that fits the budget."""
+        tiers = [parse_tier(t) for t in STT_TIERS] or [None]
+        for tier in tiers:
+            with use_stt_tier(tier):
+                settings = fw_settings()
+            if tier is None or _estimate_model_mb(settings[0], settings[2]) <= self.budget_mb:
+                self.get(*settings)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "loaded": [k[0] + "/" + k[2] for k in self._models],
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+            }
+
+
+MODEL_REGISTRY = WhisperModelRegistry(FW_MODEL_CACHE_MB)
+
+
+def _fw_iter_segments(segments, offset: float = 0.0) -> Iterator[Tuple[Dict, List[Dict]]]:
+    """Yield (item, words) per non-empty faster-whisper segment, shifted by
+    offset. Words carry sent_index 0 (their own item)."""
+    for seg in segments:
+        txt = (seg.text or '').strip()
+        if not txt:
+            continue
+        s = float(seg.start or 0.0)
+        e = float(seg.end or 0.0)
+        words: List[Dict] = []
+        for wi, w in enumerate(getattr(seg, 'words', []) or []):
+            wtxt = (getattr(w, 'word', '') or '').strip()
+            if not wtxt:
+                continue
+            ws = float(getattr(w, 'start', 0.0) or 0.0)
+            we = float(getattr(w, 'end', ws) or ws)
+            words.append({
+                "start": ws + offset,
+                "duration": max(0.0, we - ws),
+                "text": wtxt,
+                "sent_index": 0,
+                "word_index": wi,
+            })
+        yield {"start": s + offset, "duration": max(0.0, e - s), "text": txt}, words
+
+
+def _fw_collect(segments, offset: float = 0.0) -> Tuple[List[Dict], List[Dict]]:
+    """Flatten faster-whisper segments into items/words shifted by offset.
+
+    sent_index is the index of the word's item in the returned items list.
+    """
+    items: List[Dict] = []
+    words_out: List[Dict] = []
+    for item, words in _fw_iter_segments(segments, offset):
+        si = len(items)
+        items.append(item)
+        for w in words:
+            w["sent_index"] = si
+            words_out.append(w)
+    return items, words_out
+
+
+def audio_duration_seconds(audio: AudioSource) -> Optional[float]:
+    if isinstance(audio, bytes):
+        return len(audio) / (2.0 * SAMPLE_RATE)
+    if not isinstance(audio, str):
+        return None
+    try:
+        with wave.open(audio, "rb") as w:
+            return w.getnframes() / float(w.getframerate())
+    except Exception:
+        return None
+
+
+def plan_audio_chunks(audio, chunk_seconds: float) -> List[Tuple[int, int]]:
+    """Split 16 kHz samples into (start, end) ranges cut at VAD silences.
+
+    Each cut is the silence midpoint closest to the target length within a
+    +-25% window. Where no silence is found the cut is hard and the next
+    chunk starts CHUNK_OVERLAP_SECONDS earlier; ChunkStitcher drops the
+    duplicated segments.
+    """
+    total = len(audio)
+    target = int(chunk_seconds * SAMPLE_RATE)
+    if total <= target * 1.25:
+        return [(0, total)]
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=300, speech_pad_ms=100))
+    gaps = [(a["end"] + b["start"]) // 2 for a, b in zip(speech, speech[1:]) if b["start"] > a["end"]]
+    overlap = int(CHUNK_OVERLAP_SECONDS * SAMPLE_RATE)
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    pos = 0
+    while total - pos > target * 1.25:
+        ideal = pos + target
+        window = target // 4
+        cands = [g for g in gaps if ideal - window <= g <= ideal + window]
+        if cands:
+            cut, hard = min(cands, key=lambda g: abs(g - ideal)), False
+        else:
+            cut, hard = ideal, True
+        ranges.append((start, cut))
+        start = max(0, cut - overlap) if hard else cut
+        pos = cut
+    ranges.append((start, total))
+    return ranges
+
+
+class ChunkStitcher:
+    """Merges per-chunk STT results fed in time order.
+
+    Where chunks overlap, a segment running into the hard cut is taken from
+    the following chunk (which heard it whole), and segments of that chunk
+    that were already covered by the previous one are dropped. A segment
+    that started before the overlap is kept cut short instead, and the
+    following chunk's segments starting before its end are dropped, so the
+    overlap text appears once.
+    """
+
+    def __init__(self):
+        self.kept_end = float("-inf")
+        self.cut_end = float("-inf")
+
+    def add(self, c_end: float, next_start: Optional[float], c_items: List[Dict], c_words: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Kept (items, words) of one chunk; sent_index refers to the returned items."""
+        items: List[Dict] = []
+        remap: Dict[int, int] = {}
+        hard_cut = next_start is not None and next_start < c_end
+        cut_end = float("-inf")
+        for li, it in enumerate(c_items):
+            end = it["start"] + it["duration"]
+            if it["start"] < self.cut_end or it["start"] + it["duration"] / 2 < self.kept_end:
+                continue
+            if hard_cut and end > c_end - 0.1:
+                if it["start"] >= next_start:
+                    continue
+                cut_end = max(cut_end, end)
+            remap[li] = len(items)
+            items.append(it)
+            self.kept_end = max(self.kept_end, end)
+        self.cut_end = cut_end
+        words = [dict(w, sent_index=remap[w["sent_index"]]) for w in c_words if w["sent_index"] in remap]
+        return items, words
+
+
+# --- Artifact cache ---
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ArtifactCache:
+    """On-disk cache of per-video artifacts keyed by (kind, video_id, params).
+
+    Kinds used by the worker: "captions" (raw caption text and format),
+    "audio" (16 kHz mono s16le PCM) and "transcript" (STT items, words and
+    source language). Entries are files named by the sha256 of the key and
+    written under a temp name then renamed, so slots and workers sharing the
+    directory never see partial entries. Reads refresh the file mtime;
+    entries older than ttl_hours are misses, and past max_mb the least
+    recently used files are deleted down to ~90%.
+    """
+
+    def __init__(self, root: str, max_mb: int, ttl_hours: float):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root) and self.max_bytes > 0
+
+    def _path(self, kind: str, video_id: str, params: Dict) -> str:
+        raw = json.dumps([kind, video_id, params], sort_keys=True)
+        return os.path.join(self.root, kind, hashlib.sha256(raw.encode("utf-8")).hexdigest())
+
+    def get(self, kind: str, video_id: str, params: Dict) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        path = self._path(kind, video_id, params)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, kind: str, video_id: str, params: Dict, data: bytes) -> None:
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(kind, video_id, params)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, data)
+        except OSError as e:
+            print(f"Artifact cache write failed ({kind}): {e}")
+            return
+        with self._lock:
+            self._size = self._scan()[1] if self._size is None else self._size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get_json(self, kind: str, video_id: str, params: Dict) -> Optional[Dict]:
+        data = self.get(kind, video_id, params)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, kind: str, video_id: str, params: Dict, value: Dict) -> None:
+        self.put(kind, video_id, params, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def _scan(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        entries = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries, sum(e[1] for e in entries)
+
+    def _evict(self) -> None:
+        # Rescan: other workers sharing the directory change it too.
+        entries, total = self._scan()
+        budget = int(self.max_bytes * 0.9)
+        cutoff = time.time() - self.ttl
+        for mtime, size, path in sorted(entries):
+            if total <= budget and mtime >= cutoff:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+ARTIFACT_CACHE = ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_MB, ARTIFACT_CACHE_TTL_HOURS)
+
+
+def transcript_cache_params(stt_lang: str) -> Dict:
+    """Cache parameters of an STT run: engine, model settings and language."""
+    engine = os.environ.get("STT_ENGINE", "faster_whisper").lower()
+    params = {"engine": engine, "lang": stt_lang.lower(), "max_seconds": MAX_AUDIO_SECONDS, "speech_trim": SPEECH_TRIM}
+    if engine != "openai":
+        model_name, _, compute_type, _ = fw_settings()
+        params.update(model=model_name, compute=compute_type)
+    return params
+
+
+# --- Checkpoints ---
+
+
+class JobCheckpoint:
+    """STT progress of one video under CHECKPOINT_DIR/<video_id>/.
+
+    Holds the acquired audio and, per transcription key (language, model and
+    window settings), the window plan plus one JSON file per finished window.
+    Files are written to a temp name and renamed, so a crash never leaves a
+    half-written checkpoint behind.
+    """
+
+    def __init__(self, root: str, video_id: str):
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_-]", "_", video_id))
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _audio_base(self) -> str:
+        return os.path.join(self.dir, f"audio-{acquire_seconds() or 'full'}")
+
+    def load_audio(self) -> Optional[AudioSource]:
+        base = self._audio_base()
+        if os.path.exists(base + ".wav"):
+            return base + ".wav"
+        if os.path.exists(base + ".pcm"):
+            with open(base + ".pcm", "rb") as f:
+                return f.read()
+        return None
+
+    def save_audio(self, audio: AudioSource) -> AudioSource:
+        """Persist acquired audio; file audio is returned as the checkpoint copy."""
+        base = self._audio_base()
+        if isinstance(audio, str):
+            tmp = f"{base}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(audio, tmp)
+            os.replace(tmp, base + ".wav")
+            return base + ".wav"
+        pcm = audio.read() if hasattr(audio, "read") else audio
+        _atomic_write(base + ".pcm", pcm)
+        return pcm
+
+    def transcript_dir(self, lang: str, settings: Tuple) -> str:
+        raw = json.dumps([lang, list(settings), LONG_AUDIO_CHUNK_SECONDS, CHUNK_OVERLAP_SECONDS, SPEECH_TRIM])
+        path = os.path.join(self.dir, "stt-" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def load_plan(tdir: str, total: int) -> Optional[List[Tuple[int, int]]]:
+        try:
+            with open(os.path.join(tdir, "plan.json"), "r", encoding="utf-8") as f:
+                ranges = [tuple(r) for r in json.load(f)]
+        except (OSError, ValueError):
+            return None
+        # A plan made for different audio cannot be resumed.
+        return ranges if ranges and ranges[-1][1] == total else None
+
+    @staticmethod
+    def save_plan(tdir: str, ranges: List[Tuple[int, int]]) -> None:
+        # Windows of an earlier plan do not line up with the new one.
+        for name in os.listdir(tdir):
+            if name.startswith("window-"):
+                os.remove(os.path.join(tdir, name))
+        _atomic_write(os.path.join(tdir, "plan.json"), json.dumps(ranges).encode("utf-8"))
+
+    @staticmethod
+    def load_window(tdir: str, index: int) -> Optional[Tuple[List[Dict], List[Dict], Optional[str]]]:
+        try:
+            with open(os.path.join(tdir, f"window-{index:05d}.json"), "r", encoding="utf-8") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return d["items"], d["words"], d.get("lang")
+
+    @staticmethod
+    def save_window(tdir: str, index: int, result: Tuple[List[Dict], List[Dict], Optional[str]]) -> None:
+        items, words, lang = result
+        data = json.dumps({"items": items, "words": words, "lang": lang}, ensure_ascii=False)
+        _atomic_write(os.path.join(tdir, f"window-{index:05d}.json"), data.encode("utf-8"))
+
+    def clear(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def prune_checkpoints(root: str, ttl_hours: float) -> int:
+    """Remove checkpoints of videos nobody touched for ttl_hours."""
+    if not root or not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - ttl_hours * 3600
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"Pruned {removed} stale checkpoint(s) from {root}")
+    return removed
+
+
+def _stt_process_init(threads: int) -> None:
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+
+def _transcribe_chunk(chunk, lang: str, offset: float, settings: Tuple[str, str, str, int]) -> Tuple[List[Dict], List[Dict], Optional[str]]:
+    """Runs in an STT pool process; the registry keeps the model warm per process."""
+    model = MODEL_REGISTRY.get(*settings)
+    segments, info = model.transcribe(chunk, language=lang or None, vad_filter=True, word_timestamps=True)
+    items, words = _fw_collect(segments, offset)
+    return items, words, getattr(info, "language", None)
+
+
+_STT_POOL: Optional[ProcessPoolExecutor] = None
+_STT_POOL_LOCK = threading.Lock()
+
+
+def stt_pool() -> ProcessPoolExecutor:
+    global _STT_POOL
+    with _STT_POOL_LOCK:
+        if _STT_POOL is None:
+            # spawn: the parent runs heartbeat threads, which fork() would not copy safely
+            _STT_POOL = ProcessPoolExecutor(
+                max_workers=STT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_stt_process_init,
+                initargs=(STT_PROCESS_THREADS,),
+            )
+        return _STT_POOL
+
+
+def transcribe_long_audio(audio, lang: str, sink: Optional["ResultStreamer"] = None,
+                          checkpoint: Optional[JobCheckpoint] = None) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
+    """Chunked transcription of decoded 16 kHz audio.
+
+    Chunks run across the STT process pool when STT_PROCESSES > 1, otherwise
+    one after another in this process. With a checkpoint, the chunk plan and
+    each finished chunk are saved and chunks finished by an earlier attempt
+    are not transcribed again. With a sink, each chunk's stitched segments
+    are handed over as soon as that chunk and all earlier ones are done, and
+    empty lists are returned.
+    """
+    model_name, device, compute_type, cpu_threads = fw_settings()
+    pooled = STT_PROCESSES > 1
+    settings = (model_name, device, compute_type, STT_PROCESS_THREADS if pooled else cpu_threads)
+    tdir = checkpoint.transcript_dir(lang, settings[:3]) if checkpoint else None
+    ranges = JobCheckpoint.load_plan(tdir, len(audio)) if tdir else None
+    if ranges is None:
+        ranges = plan_audio_chunks(audio, LONG_AUDIO_CHUNK_SECONDS)
+        if tdir:
+            JobCheckpoint.save_plan(tdir, ranges)
+    done: Dict[int, Tuple[List[Dict], List[Dict], Optional[str]]] = {}
+    if tdir:
+        for ci in range(len(ranges)):
+            res = JobCheckpoint.load_window(tdir, ci)
+            if res is not None:
+                done[ci] = res
+        if done:
+            print(f"Resuming from checkpoint: {len(done)}/{len(ranges)} chunks already transcribed")
+    workers = f"{STT_PROCESSES} processes x {STT_PROCESS_THREADS} threads" if pooled else "in-process"
+    print(f"Long-audio mode: {len(audio) / SAMPLE_RATE:.0f}s in {len(ranges)} chunks "
+          f"({workers}, model={model_name})")
+    if pooled:
+        pool = stt_pool()
+        futures = {
+            ci: pool.submit(_transcribe_chunk, audio[a:b], lang, a / SAMPLE_RATE, settings)
+            for ci, (a, b) in enumerate(ranges) if ci not in done
+        }
+        results = (done[ci] if ci in done else futures[ci].result() for ci in range(len(ranges)))
+    else:
+        results = (done[ci] if ci in done else _transcribe_chunk(audio[a:b], lang, a / SAMPLE_RATE, settings)
+                   for ci, (a, b) in enumerate(ranges))
+    stitcher = ChunkStitcher()
+    items: List[Dict] = []
+    words: List[Dict] = []
+    langs: Counter = Counter()
+    for ci, ((a, b), res) in enumerate(zip(ranges, results)):
+        if tdir and ci not in done:
+            JobCheckpoint.save_window(tdir, ci, res)
+        c_items, c_words, c_lang = res
+        next_start = ranges[ci + 1][0] / SAMPLE_RATE if ci + 1 < len(ranges) else None
+        k_items, k_words = stitcher.add(b / SAMPLE_RATE, next_start, c_items, c_words)
+        if c_lang:
+            langs[c_lang] += len(c_items)
+        if sink is not None:
+            sink.add(k_items, k_words, c_lang or lang, b / SAMPLE_RATE)
+            continue
+        base = len(items)
+        items.extend(k_items)
+        words.extend(dict(w, sent_index=w["sent_index"] + base) for w in k_words)
+    src = langs.most_common(1)[0][0] if langs else None
+    if sink is None:
+        # Streamed runs are logged after the sink's final flush.
+        print(f"Transcription done: {len(items)} segments; src_lang={src}")
+    return items, src, (words if words else None)
+
+
+def plan_speech_clips(audio, max_seconds: float = 30.0) -> List[Tuple[int, int]]:
+    """VAD speech regions of 16 kHz samples merged into clips of at most max_seconds."""
+    limit = int(max_seconds * SAMPLE_RATE)
+    speech = get_speech_timestamps(audio, VadOptions(max_speech_duration_s=max_seconds, min_silence_duration_ms=160))
+    clips: List[Tuple[int, int]] = []
+    for sp in speech:
+        if clips and sp["end"] - clips[-1][0] <= limit:
+            clips[-1] = (clips[-1][0], sp["end"])
+        else:
+            clips.append((sp["start"], sp["end"]))
+    return clips
+
+
+class SpeechMap:
+    """Maps times in speech-only audio back to the original audio.
+
+    regions are the (start, end) sample ranges of the original that were
+    concatenated, in order.
+    """
+
+    def __init__(self, regions: List[Tuple[int, int]]):
+        self.orig_starts = [a for a, _ in regions]
+        self.trim_starts: List[int] = []
+        pos = 0
+        for a, b in regions:
+            self.trim_starts.append(pos)
+            pos += b - a
+
+    def to_original(self, t: float, end: bool = False) -> float:
+        s = t * SAMPLE_RATE
+        # An end time on a region boundary belongs to the region before it.
+        i = (bisect_left(self.trim_starts, s) if end else bisect_right(self.trim_starts, s)) - 1
+        i = max(0, i)
+        return (self.orig_starts[i] + s - self.trim_starts[i]) / SAMPLE_RATE
+
+    def remap(self, rows: Optional[List[Dict]]) -> Optional[List[Dict]]:
+        if rows is None:
+            return None
+        out = []
+        for r in rows:
+            start = self.to_original(r["start"])
+            end = self.to_original(r["start"] + r["duration"], end=True)
+            out.append(dict(r, start=start, duration=max(0.0, end - start)))
+        return out
+
+
+def trim_to_speech(samples, max_seconds: Optional[float]) -> Tuple[object, Optional[SpeechMap]]:
+    """Concatenate the speech regions of 16 kHz samples, keeping at most
+    max_seconds of speech. Returns the samples unchanged and no map when VAD
+    finds no speech."""
+    speech = get_speech_timestamps(samples, VadOptions(min_silence_duration_ms=500, speech_pad_ms=SPEECH_TRIM_PAD_MS))
+    budget = int(max_seconds * SAMPLE_RATE) if max_seconds else None
+    regions: List[Tuple[int, int]] = []
+    kept = 0
+    for sp in speech:
+        a, b = sp["start"], sp["end"]
+        if budget is not None:
+            b = min(b, a + budget - kept)
+        if b <= a:
+            break
+        regions.append((a, b))
+        kept += b - a
+    if not regions:
+        return samples, None
+    return np.concatenate([samples[a:b] for a, b in regions]), SpeechMap(regions)
+
+
+def transcribe_batched(audios: List, lang: str) -> List[Tuple[List[Dict], Optional[str], Optional[List[Dict]]]]:
+    """Transcribe several decoded 16 kHz inputs with one BatchedInferencePipeline call.
+
+    The inputs are concatenated and their speech clips passed as
+    clip_timestamps, so a clip never spans two inputs and every segment can
+    be mapped back to its input. Returns (items, src_lang, words) per input.
+    Language detection runs once per call, so several inputs need an
+    explicit lang.
+    """
+    if BatchedInferencePipeline is None:
+        raise RuntimeError("STT_MODE=batched needs faster-whisper >= 1.1")
+    if len(audios) > 1 and not lang:
+        raise ValueError("transcribe_batched: inputs of unknown language must be transcribed one per call")
+    model_name, device, compute_type, cpu_threads = fw_settings()
+    offsets: List[int] = []
+    clips: List[Dict] = []
+    pos = 0
+    for a in audios:
+        offsets.append(pos)
+        clips.extend({"start": (pos + s) / SAMPLE_RATE, "end": (pos + e) / SAMPLE_RATE} for s, e in plan_speech_clips(a))
+        pos += len(a)
+    results: List[Tuple[List[Dict], Optional[str], Optional[List[Dict]]]] = [([], lang or None, []) for _ in audios]
+    if not clips:
+        return [(items, src, None) for items, src, _ in results]
+    total_s = pos / SAMPLE_RATE
+    print(f"Batched transcription: {len(audios)} input(s), {total_s:.0f}s, {len(clips)} speech clips, "
+          f"batch_size={FW_BATCH_SIZE} (model={model_name})")
+    model = MODEL_REGISTRY.get(model_name, device, compute_type, cpu_threads)
+    pipeline = BatchedInferencePipeline(model=model)
+    joined = audios[0] if len(audios) == 1 else np.concatenate(audios)
+    segments, info = pipeline.transcribe(
+        joined,
+        language=lang or None,
+        clip_timestamps=clips,
+        batch_size=FW_BATCH_SIZE,
+        word_timestamps=True,
+        without_timestamps=False,
+    )
+    src = getattr(info, "language", None) or lang or None
+    bounds = offsets[1:] + [pos]
+    idx = 0
+    for item, words in _fw_iter_segments(segments):
+        at = item["start"] * SAMPLE_RATE
+        while idx + 1 < len(audios) and at >= bounds[idx]:
+            idx += 1
+        shift = offsets[idx] / SAMPLE_RATE
+        items, _, words_out = results[idx]
+        item["start"] -= shift
+        for w in words:
+            w["start"] -= shift
+            w["sent_index"] = len(items)
+            words_out.append(w)
+        items.append(item)
+    return [(items, src, words or None) for items, _, words in results]
+
+
+class BatchedSTT:
+    """Groups transcriptions requested by concurrent threads into shared
+    transcribe_batched calls.
+
+    The first caller for a language waits up to wait_ms for up to max_jobs
+    more, then runs the batch in its own thread; the others block until
+    their share of the result is ready. Jobs without an explicit language
+    are never batched: one detection would apply to every video in the batch.
+    """
+
+    def __init__(self, max_jobs: int, wait_ms: int):
+        self.max_jobs = max_jobs
+        self.wait_s = wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._pending: Dict[Tuple, List[Tuple[object, Future]]] = {}
+
+    def transcribe(self, audio, lang: str) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
+        if self.max_jobs <= 1 or not lang:
+            return transcribe_batched([audio], lang)[0]
+        fut: Future = Future()
+        key = ((lang or "").lower(),) + fw_settings()[:3]
+        with self._cond:
+            batch = self._pending.setdefault(key, [])
+            batch.append((audio, fut))
+            leader = len(batch) == 1
+            self._cond.notify_all()
+            if leader:
+                self._cond.wait_for(lambda: len(batch) >= self.max_jobs, timeout=self.wait_s)
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+        if leader:
+            try:
+                # Callers in the batch share the leader's thread-local tier (same key).
+                for (_, f), res in zip(batch, transcribe_batched([a for a, _ in batch], lang)):
+                    f.set_result(res)
+            except Exception as e:
+                for _, f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+        return fut.result()
+
+
+STT_BATCHER = BatchedSTT(STT_BATCH_JOBS, STT_BATCH_WAIT_MS)
+
+
+def transcribe_with_whisper(audio: AudioSource, lang: str, sink: Optional["ResultStreamer"] = None,
+                            checkpoint: Optional[JobCheckpoint] = None) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
+    """Unified STT: prefer local faster-whisper unless STT_ENGINE=openai.
+
+    With a sink (faster-whisper only), segments are passed to sink.add as
+    they are decoded instead of being collected, and empty lists are returned.
+    With a checkpoint, faster-whisper always runs chunked so that finished
+    chunks survive a crash; otherwise STT_MODE=batched uses the batched
+    pipeline.
+    """
+    if os.environ.get("STT_ENGINE", "faster_whisper").lower() != "openai":
+        model_name, device, compute_type, cpu_threads = fw_settings()
+        if STT_MODE == "batched" and checkpoint is None and decode_audio is not None:
+            items, src, words = STT_BATCHER.transcribe(audio_to_array(audio), lang)
+            if sink is None:
+                print(f"Transcription done: {len(items)} segments; src_lang={src}")
+                return items, src, words
+            sink.add(items, words or [], src or lang, items[-1]["start"] + items[-1]["duration"] if items else 0.0)
+            return [], src, None
+        stt_input = audio if isinstance(audio, str) else audio_to_array(audio)
+        if (STT_PROCESSES > 1 or checkpoint is not None) and decode_audio is not None:
+            duration = audio_duration_seconds(audio) if isinstance(audio, str) else len(stt_input) / SAMPLE_RATE
+            if checkpoint is not None or duration is None or duration >= LONG_AUDIO_MIN_SECONDS:
+                if isinstance(stt_input, str):
+                    stt_input = audio_to_array(stt_input)
+                if checkpoint is not None or len(stt_input) >= LONG_AUDIO_MIN_SECONDS * SAMPLE_RATE:
+                    return transcribe_long_audio(stt_input, lang, sink, checkpoint)
+        print(f"Transcribing with faster-whisper model={model_name} device={device} compute={compute_type} ...")
+        model = MODEL_REGISTRY.get(model_name, device, compute_type, cpu_threads)
+        segments, info = model.transcribe(
+            stt_input,
+            language=lang or None,
+            vad_filter=True,
+            word_timestamps=True,
+        )
+        src = getattr(info, 'language', None)
+        if sink is not None:
+            if getattr(info, "duration", None):
+                sink.duration = float(info.duration)
+            for item, words in _fw_iter_segments(segments):
+                sink.add([item], words, src or lang, item["start"] + item["duration"])
+            return [], src, None
+        items, words_out = _fw_collect(segments)
+        print(f"Transcription done: {len(items)} segments; src_lang={src}")
+        return items, src, (words_out if words_out else None)
+
+    if not OPENAI_API_KEY:
+        raise RuntimeError("Missing OPENAI_API_KEY")
+    timeout = float(os.environ.get("OPENAI_REQUEST_TIMEOUT_SEC", "120"))
+    print(f"Transcribing with Whisper (timeout={timeout}s)...")
+    client = OpenAI(api_key=OPENAI_API_KEY, timeout=timeout)
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            upload = ("audio.wav", f.read())
+    else:
+        pcm = audio.read() if hasattr(audio, "read") else audio
+        upload = ("audio.wav", pcm_to_wav_bytes(pcm))
+    tr = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=upload,
+            response_format="verbose_json",
+            language=lang if lang else None,
+        )
+    items: List[Dict] = []
+    for seg in tr.segments:
+        start = float(seg.get("start", 0.0))
+        end = float(seg.get("end", start))
+        text = (seg.get("text") or "").strip()
+        if text:
+            items.append({
+                "start": start,
+                "duration": max(0.0, end - start),
+                "text": text,
+            })
+    src_lang = getattr(tr, "language", None)
+    print(f"Transcription done: {len(items)} segments; src_lang={src_lang}")
+    return items, src_lang, None
+
+
+# --- STT tiering ---
+# Realtime factors (processing seconds per audio second) of int8
+# faster-whisper on a few CPU cores. STT_TIER_RTF overrides entries, and
+# every transcription nudges its model's value toward what was measured.
+_TIER_RTF: Dict[str, float] = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.3,
+    "medium": 0.8,
+    "distil-large-v3": 0.9,
+    "large-v3-turbo": 0.9,
+    "large-v2": 1.6,
+    "large-v3": 1.6,
+}
+for _part in STT_TIER_RTF.split(","):
+    _name, _, _value = _part.partition("=")
+    if _name.strip() and _value.strip():
+        _TIER_RTF[_name.strip()] = float(_value)
+_TIER_RTF_LOCK = threading.Lock()
+
+
+def parse_tier(spec: str) -> Tuple[str, str]:
+    model, _, compute = spec.partition(":")
+    return model.strip(), (compute.strip() or os.environ.get("FW_COMPUTE_TYPE", "int8"))
+
+
+def tier_rtf(model_name: str) -> float:
+    with _TIER_RTF_LOCK:
+        return _TIER_RTF.get(model_name, 0.5)
+
+
+def record_rtf(model_name: str, seconds: float, audio_seconds: float) -> None:
+    if audio_seconds < 10:
+        return  # warm-up dominates short clips
+    measured = seconds / audio_seconds
+    with _TIER_RTF_LOCK:
+        old = _TIER_RTF.get(model_name)
+        _TIER_RTF[model_name] = measured if old is None else 0.8 * old + 0.2 * measured
+
+
+_BACKLOG = {"count": 0, "at": float("-inf")}
+_BACKLOG_LOCK = threading.Lock()
+
+
+def queued_backlog() -> int:
+    """Queued job count from PostgREST (Prefer: count=exact), cached BACKLOG_CACHE_SECONDS."""
+    with _BACKLOG_LOCK:
+        if time.monotonic() - _BACKLOG["at"] < BACKLOG_CACHE_SECONDS:
+            return _BACKLOG["count"]
+    r = http().get(
+        rest("/subtitle_jobs"),
+        params={"select": "id", "status": "eq.queued", "limit": "1"},
+        headers={**auth_headers(), "Prefer": "count=exact"},
+        timeout=10,
+    )
+    r.raise_for_status()
+    total = r.headers.get("Content-Range", "*/0").rsplit("/", 1)[-1]
+    count = int(total) if total.isdigit() else len(r.json())
+    with _BACKLOG_LOCK:
+        _BACKLOG.update(count=count, at=time.monotonic())
+    return count
+
+
+def choose_stt_tier(duration: Optional[float], backlog: int) -> Optional[Tuple[str, str]]:
+    """Best STT_TIERS entry whose estimated time to transcribe this job and
+    the backlog behind it (assumed to be of similar length, shared by
+    STT_CONCURRENCY slots) fits STT_LATENCY_SLO_SECONDS; the fastest tier
+    when none does."""
+    if not STT_TIERS:
+        return None
+    tiers = [parse_tier(t) for t in STT_TIERS]
+    audio_s = duration or MAX_AUDIO_SECONDS or 600
+    for model_name, compute_type in tiers:
+        if audio_s * tier_rtf(model_name) * (1 + backlog / STT_CONCURRENCY) <= STT_LATENCY_SLO_SECONDS:
+            return model_name, compute_type
+    return tiers[-1]
+
+
+def select_stt_tier(ctx: Dict) -> Optional[Tuple[str, str]]:
+    """choose_stt_tier for ctx's audio and the current backlog; records the choice on the job."""
+    if not STT_TIERS:
+        return None
+    backlog = 0
+    if ctx.get("job") is not None:
+        try:
+            backlog = queued_backlog()
+        except Exception as e:
+            print(f"Backlog count failed: {e}")
+    duration = audio_duration_seconds(ctx["audio"])
+    tier = choose_stt_tier(duration, backlog)
+    ctx["stt_tier"] = f"{tier[0]}:{tier[1]}"
+    print(f"STT tier {ctx['stt_tier']} (audio {duration or 0:.0f}s, backlog {backlog})")
+    for job in [ctx.get("job")] + ctx.get("duplicates", []):
+        if job is not None:
+            record_stt_tier(job["id"], ctx["stt_tier"])
+    return tier
+
+
+def identify_language(audio: AudioSource, fallback: str) -> str:
+    """Spoken language of the first 30 s by STT_LANGUAGE_ID_MODEL, or
+    fallback when detection is unavailable or unsure."""
+    try:
+        if isinstance(audio, str):
+            with wave.open(audio, "rb") as w:
+                audio = w.readframes(30 * SAMPLE_RATE)
+        samples = audio_to_array(audio)[: 30 * SAMPLE_RATE]
+        _, device, _, cpu_threads = fw_settings()
+        model = MODEL_REGISTRY.get(STT_LANGUAGE_ID_MODEL, device, "int8", cpu_threads)
+        if not hasattr(model, "detect_language"):
+            return fallback  # faster-whisper < 1.1
+        with span("language_id"):
+            lang, prob, _ = model.detect_language(audio=samples)
+    except Exception as e:
+        print(f"Language ID failed: {e}")
+        return fallback
+    print(f"Language ID: {lang} (p={prob:.2f})")
+    return lang if prob >= STT_LANGUAGE_ID_MIN_PROB else fallback
+
+
+# --- Translation ---
+def _normalize_line(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TranslationCache:
+    """SQLite-backed translation memo keyed by (engine, source, target, text).
+
+    Rows carry a last-used time; past max_rows the least recently used ~10%
+    are deleted. Shared by all slots of a worker (and by workers on the same
+    disk). The table is counted only when a running estimate (the last count
+    plus rows put since) passes max_rows.
+    """
+
+    def __init__(self, path: str, max_rows: int):
+        self.path = path
+        self.max_rows = max_rows
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._rows: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(engine: str, source: str, target: str, text: str) -> str:
+        return hashlib.sha1(f"{engine}\x1f{source}\x1f{target}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("create table if not exists translations (key text primary key, text text not null, used_at real not null)")
+            conn.execute("create index if not exists translations_used_at on translations (used_at)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, engine: str, source: str, target: str, texts: List[str]) -> Dict[str, str]:
+        if self.max_rows <= 0 or not texts:
+            return {}
+        keys = {self._key(engine, source, target, t): t for t in texts}
+        found: Dict[str, str] = {}
+        with self._lock:
+            db = self._db()
+            kl = list(keys)
+            for i in range(0, len(kl), 500):
+                part = kl[i:i + 500]
+                rows = db.execute(
+                    f"select key, text from translations where key in ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for k, txt in rows:
+                    found[keys[k]] = txt
+                if rows:
+                    db.executemany("update translations set used_at = ? where key = ?", [(time.time(), k) for k, _ in rows])
+            db.commit()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, engine: str, source: str, target: str, pairs: Dict[str, str]) -> None:
+        if self.max_rows <= 0 or not pairs:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "insert or replace into translations (key, text, used_at) values (?, ?, ?)",
+                [(self._key(engine, source, target, src), dst, now) for src, dst in pairs.items()],
+            )
+            # Replaced keys count as new rows, so the estimate never falls short
+            # of this process's own inserts.
+            if self._rows is not None:
+                self._rows += len(pairs)
+            if self._rows is None or self._rows > self.max_rows:
+                self._rows = db.execute("select count(*) from translations").fetchone()[0]
+                if self._rows > self.max_rows:
+                    excess = self._rows - int(self.max_rows * 0.9)
+                    db.execute(
+                        "delete from translations where key in (select key from translations order by used_at limit ?)",
+                        (excess,),
+                    )
+                    self._rows -= excess
+            db.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+TRANSLATION_CACHE = TranslationCache(TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_MAX_ROWS)
+_ARGOS_TRANSLATORS: Dict[Tuple[str, str], object] = {}
+_ARGOS_LOCK = threading.Lock()
+
+
+def get_argos_translator(source_lang: str, target_lang: str):
+    """Resolve (and install if allowed) the Argos translator once per pair."""
+    key = (source_lang, target_lang)
+    with _ARGOS_LOCK:
+        translator = _ARGOS_TRANSLATORS.get(key)
+        if translator is not None:
+            return translator
+        installed = argos_package.get_installed_packages()
+        if not any(p.from_code == source_lang and p.to_code == target_lang for p in installed):
+            if ARGOS_AUTO_DOWNLOAD:
+                avail = argos_package.get_available_packages()
+                match = next((p for p in avail if p.from_code == source_lang and p.to_code == target_lang), None)
+                if match:
+                    path = argos_package.download_package(match)
+                    argos_package.install_from_path(path)
+            installed = argos_package.get_installed_packages()
+            if not any(p.from_code == source_lang and p.to_code == target_lang for p in installed):
+                raise RuntimeError(f"Argos language pack not installed for {source_lang}->{target_lang}")
+        translator = argos_translate.get_translation_from_codes(source_lang, target_lang)
+        _ARGOS_TRANSLATORS[key] = translator
+        return translator
+
+
+def _translate_lines_openai(lines: List[str], target_lang: str, source_lang: str | None) -> List[str]:
+    if not OPENAI_API_KEY:
+        raise RuntimeError("Missing OPENAI_API_KEY for translation")
+    client = OpenAI(api_key=OPENAI_API_KEY)
+    out: List[str] = []
+    chunk_size = 50
+    sys = (
+        f"You are a professional subtitle translator. Translate from {source_lang or 'auto-detected'} to {target_lang}. "
+        "Keep the number of lines the same as the input. Return only the translations, one per line, no numbering."
+    )
+    for i in range(0, len(lines), chunk_size):
+        chunk = lines[i:i+chunk_size]
+        resp = client.chat.completions.create(
+            model=OPENAI_TRANSLATE_MODEL,
+            messages=[{"role": "system", "content": sys}, {"role": "user", "content": "\n".join(chunk)}],
+            temperature=0.2,
+        )
+        text = resp.choices[0].message.content or ""
+        got = [ln.strip() for ln in text.splitlines() if ln.strip()]
+        if len(got) != len(chunk):
+            got = []
+            for x in chunk:
+                one = client.chat.completions.create(
+                    model=OPENAI_TRANSLATE_MODEL,
+                    messages=[{"role": "system", "content": sys}, {"role": "user", "content": x}],
+                    temperature=0.2,
+                ).choices[0].message.content or ""
+                got.append(one.strip())
+        out.extend(got)
+    return out
+
+
+def _translate_lines_argos(lines: List[str], target_lang: str, source_lang: str | None) -> List[str]:
+    if argos_package is None or argos_translate is None:
+        raise RuntimeError("argostranslate is not available; install it or set TRANSLATE_ENGINE=openai")
+    if not source_lang:
+        raise RuntimeError("source_lang is required for Argos translation (use STT-detected language)")
+    translator = get_argos_translator(source_lang, target_lang)
+    return [translator.translate(x) for x in lines]
+
+
+def translate_items(items: List[Dict], target_lang: str, source_lang: str | None = None) -> List[Dict]:
+    """Translate item texts, sending each distinct line to the engine at most once.
+
+    Lines are whitespace-normalized and de-duplicated within the batch, then
+    looked up in TRANSLATION_CACHE; only misses reach the engine.
+    """
+    if TRANSLATE_ENGINE == "openai":
+        engine, translate_lines = f"openai:{OPENAI_TRANSLATE_MODEL}", _translate_lines_openai
+    else:
+        engine, translate_lines = "argos", _translate_lines_argos
+    texts = [_normalize_line(it.get("text") or "") for it in items]
+    unique = list(dict.fromkeys(t for t in texts if t))
+    src_key = source_lang or "auto"
+    done = TRANSLATION_CACHE.get_many(engine, src_key, target_lang, unique)
+    missing = [t for t in unique if t not in done]
+    if missing:
+        with span("translate"):
+            fresh = dict(zip(missing, translate_lines(missing, target_lang, source_lang)))
+        TRANSLATION_CACHE.put_many(engine, src_key, target_lang, fresh)
+        done.update(fresh)
+    print(f"Translated {len(items)} lines ({len(unique)} unique, {len(unique) - len(missing)} cached); "
+          f"cache {TRANSLATION_CACHE.stats()}")
+    return [
+        {"start": it["start"], "duration": it["duration"], "text": done.get(t, "")}
+        for it, t in zip(items, texts)
+    ]
+
+
+def lease_deadline_iso() -> str:
+    return datetime.fromtimestamp(time.time() + JOB_LEASE_SECONDS, timezone.utc).isoformat()
+
+
+# Word-like runs for scripts written without spaces: Han, hiragana and
+# katakana runs are split apart; everything else splits on whitespace.
+_WORD_RUN_RE = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+"
+    r"|[\u3040-\u309f]+"
+    r"|[\u30a0-\u30ff\uff66-\uff9f]+"
+    r"|[^\s\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]+"
+)
+
+
+def tokenize_translated(text: str) -> List[str]:
+    toks: List[str] = []
+    for tok in _WORD_RUN_RE.findall(text):
+        if toks and not any(c.isalnum() for c in tok):
+            toks[-1] += tok  # keep trailing punctuation (。！) on its word
+        else:
+            toks.append(tok)
+    return toks
+
+
+def get_queued_jobs(limit: int) -> List[Dict]:
+    r = http().get(
+        rest("/subtitle_jobs"),
+        params={
+            "select": "id,video_id,lang,created_at",
+            "status": "eq.queued",
+            "order": "created_at.asc",
+            "limit": str(limit),
+        },
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    return r.json()
+
+
+def claim_job(job_id: str) -> Dict | None:
+    """Atomically move a job from queued to processing.
+
+    The PATCH is conditional on status=eq.queued, so when several workers race
+    for the same row only one of them gets it back in the response.
+    """
+    r = http().patch(
+        rest("/subtitle_jobs"),
+        params={"id": f"eq.{job_id}", "status": "eq.queued"},
+        json={
+            "status": "processing",
+            "worker_id": WORKER_ID,
+            "lease_expires_at": lease_deadline_iso(),
+            "updated_at": now_utc_iso(),
+        },
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    rows = r.json()
+    return rows[0] if rows else None
+
+
+def claim_next_job() -> Dict | None:
+    for cand in get_queued_jobs(CLAIM_CANDIDATES):
+        job = claim_job(cand["id"])
+        if job:
+            return job
+    return None
+
+
+def claim_video_jobs(video_id: str, limit: int) -> List[Dict]:
+    """Claim other queued jobs for video_id (any language)."""
+    r = http().get(
+        rest("/subtitle_jobs"),
+        params={
+            "select": "id,video_id,lang,created_at",
+            "status": "eq.queued",
+            "video_id": f"eq.{video_id}",
+            "order": "created_at.asc",
+            "limit": str(limit),
+        },
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    claimed = []
+    for cand in r.json():
+        job = claim_job(cand["id"])
+        if job:
+            claimed.append(job)
+    return claimed
+
+
+def claim_jobs() -> List[Dict]:
+    """Claim the next job plus, with COALESCE_JOBS, queued jobs for the same video."""
+    job = claim_next_job()
+    if not job:
+        return []
+    jobs = [job]
+    if COALESCE_JOBS and COALESCE_MAX_JOBS > 1:
+        try:
+            jobs += claim_video_jobs(job["video_id"], COALESCE_MAX_JOBS - 1)
+        except Exception as e:
+            print(f"Coalescing claim failed for {job['video_id']}: {e}")
+    return jobs
+
+
+def renew_lease(job_id: str) -> bool:
+    r = http().patch(
+        rest("/subtitle_jobs"),
+        params={"id": f"eq.{job_id}", "worker_id": f"eq.{WORKER_ID}", "status": "eq.processing"},
+        json={"lease_expires_at": lease_deadline_iso(), "updated_at": now_utc_iso()},
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    return bool(r.json())
+
+
+def requeue_expired_leases() -> int:
+    """Return jobs whose worker stopped heartbeating to the queue."""
+    r = http().patch(
+        rest("/subtitle_jobs"),
+        params={"status": "eq.processing", "lease_expires_at": f"lt.{now_utc_iso()}"},
+        json={"status": "queued", "worker_id": None, "lease_expires_at": None, "updated_at": now_utc_iso()},
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    rows = r.json()
+    if rows:
+        print(f"Requeued {len(rows)} job(s) with expired leases")
+    return len(rows)
+
+
+class LeaseHeartbeat:
+    """Extends claimed jobs' leases in the background while they are processed.
+
+    Covers one job plus any duplicates attached to it later with add().
+    """
+
+    def __init__(self, job_id: str):
+        self.job_ids = [job_id]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def add(self, job_id: str) -> None:
+        with self._lock:
+            self.job_ids.append(job_id)
+
+    def _run(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._lock:
+                ids = list(self.job_ids)
+            for job_id in ids:
+                try:
+                    if not renew_lease(job_id):
+                        print(f"Lease lost for job {job_id}")
+                        with self._lock:
+                            self.job_ids.remove(job_id)
+                except Exception as e:
+                    print(f"Lease heartbeat error for job {job_id}: {e}")
+            if not ids:
+                return
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+def update_job(job_id: str, status: str, error_message: str | None = None) -> bool:
+    """Record the final status, only while this worker still holds the job.
+
+    Conditional like renew_lease: once the lease was reaped and another
+    worker claimed the row, a late result must not overwrite theirs.
+    """
+    body = {"status": status, "updated_at": now_utc_iso()}
+    if error_message:
+        body["error_message"] = error_message[:500]
+    r = http().patch(
+        rest("/subtitle_jobs"),
+        params={"id": f"eq.{job_id}", "worker_id": f"eq.{WORKER_ID}", "status": "eq.processing"},
+        json=body,
+        headers=auth_headers(),
+        timeout=20,
+    )
+    r.raise_for_status()
+    if not r.json():
+        print(f"Job {job_id} is no longer held by this worker; {status} result not recorded")
+        return False
+    return True
+
+
+# Upsert keys per table; retried chunks update rows instead of duplicating them.
+_CONFLICT_KEYS = {
+    "subtitles": ("video_id", "lang", "sent_index"),
+    "subtitle_words": ("video_id", "lang", "sent_index", "word_index"),
+}
+
+
+class _RetryableWrite(Exception):
+    pass
+
+
+def _is_body_encoding_error(r: requests.Response) -> bool:
+    """True when the endpoint could not read a gzip body (415, or PostgREST's
+    invalid-JSON error PGRST102), as opposed to any other rejected write."""
+    if r.status_code == 415:
+        return True
+    if r.status_code != 400:
+        return False
+    try:
+        err = r.json()
+    except ValueError:
+        return False
+    return isinstance(err, dict) and (err.get("code") == "PGRST102" or "invalid json" in str(err.get("message", "")).lower())
+
+
+def _post_chunk(table: str, rows: Union[List[Dict], bytes]) -> None:
+    """POST one chunk: row dicts, or a JSON array already serialized."""
+    global WRITE_GZIP
+    keys = _CONFLICT_KEYS[table]
+    if isinstance(rows, bytes):
+        payload = rows
+    else:
+        payload = json.dumps(rows, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    attempt = 0
+    while True:
+        headers = auth_headers()
+        headers["Prefer"] = "resolution=merge-duplicates,return=minimal"
+        use_gzip = WRITE_GZIP
+        body = payload
+        if use_gzip:
+            body = gzip.compress(payload, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            r = http().post(rest(f"/{table}"), params={"on_conflict": ",".join(keys)},
+                            data=body, headers=headers, timeout=60)
+            if use_gzip and _is_body_encoding_error(r):
+                # Endpoint does not accept compressed bodies; fall back for the rest of the process.
+                print(f"{table}: gzip request body rejected ({r.status_code}); sending uncompressed")
+                WRITE_GZIP = False
+                continue
+            if r.status_code == 429 or r.status_code >= 500:
+                raise _RetryableWrite(f"{table}: HTTP {r.status_code}")
+            r.raise_for_status()
+            return
+        except (requests.ConnectionError, requests.Timeout, _RetryableWrite) as e:
+            if attempt >= WRITE_RETRIES:
+                raise
+            delay = min(8.0, 0.5 * 2 ** attempt)
+            attempt += 1
+            print(f"Write retry {attempt}/{WRITE_RETRIES} in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+
+def bulk_upsert_cues(table: str, video_id: str, lang: str, cues: CueTable) -> None:
+    """Idempotently upsert cues in WRITE_CHUNK_ROWS chunks, WRITE_MAX_INFLIGHT at a time,
+    serializing the chunks straight from the table's columns."""
+    if not len(cues):
+        return
+    word_rows = table == "subtitle_words"
+    keys = zip(cues.sent_index, cues.word_index) if word_rows else cues.sent_index
+    # One statement may not touch the same key twice; the last row wins.
+    last = {k: i for i, k in enumerate(keys)}
+    if len(last) < len(cues):
+        cues = cues.take(sorted(last.values()))
+    chunks = [payload for payload, _ in cues.json_chunks(video_id, lang, WRITE_CHUNK_ROWS, word_rows)]
+    _post_chunks(table, chunks, len(cues))
+
+
+def _post_chunks(table: str, chunks: List, n_rows: int) -> None:
+    with span("db_write"):
+        if len(chunks) == 1:
+            _post_chunk(table, chunks[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(WRITE_MAX_INFLIGHT, len(chunks))) as ex:
+                for fut in [ex.submit(_post_chunk, table, c) for c in chunks]:
+                    fut.result()
+    METRICS.inc("worker_rows_written_total", n_rows, table=table)
+    ctx = getattr(_CURRENT_JOB, "ctx", None)
+    if ctx is not None:
+        ctx["rows_written"] = ctx.get("rows_written", 0) + n_rows
+
+
+def insert_subtitles(video_id: str, lang: str, items: List[Dict], sent_base: int = 0) -> None:
+    """Subtitle rows keyed by sent_index (sent_base + position); cues may share a start time."""
+    bulk_upsert_cues("subtitles", video_id, lang, CueTable.numbered(items, sent_base))
+
+
+def insert_subtitle_words(video_id: str, lang: str, words: Union[List[Dict], CueTable]) -> None:
+    bulk_upsert_cues("subtitle_words", video_id, lang, CueTable.from_rows(words))
+
+
+def delete_cues_from(video_id: str, lang: str, sent_index: int) -> None:
+    """Delete subtitles and words at sent_index and beyond: the tail of an
+    earlier, longer transcript that the upsert did not overwrite."""
+    with span("db_write"):
+        for table in ("subtitle_words", "subtitles"):
+            r = http().delete(
+                rest(f"/{table}"),
+                params={"video_id": f"eq.{video_id}", "lang": f"eq.{lang}", "sent_index": f"gte.{sent_index}"},
+                headers=auth_headers(),
+                timeout=20,
+            )
+            r.raise_for_status()
+
+
+def export_transcript(video_id: str, lang: str, items: List[Dict],
+                      words: Union[List[Dict], CueTable], out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT) -> List[str]:
+    """Write subtitles and words of one language to out_dir/<video_id>/ as
+    Parquet (fmt="parquet") or Arrow IPC files (fmt="arrow"). Returns the paths."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; pip install pyarrow to export transcripts")
+    base = os.path.join(out_dir, video_id)
+    os.makedirs(base, exist_ok=True)
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    paths = []
+    for kind, cues in (("subtitles", CueTable.numbered(items)), ("words", CueTable.from_rows(words))):
+        table = cues.to_arrow(video_id, lang)
+        path = os.path.join(base, f"{lang}.{kind}.{ext}")
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        if fmt == "parquet":
+            import pyarrow.parquet as pq  # type: ignore
+            pq.write_table(table, tmp, compression="zstd")
+        else:
+            import pyarrow.ipc as ipc  # type: ignore
+            with ipc.new_file(tmp, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def prepare_outputs(lang: str, items: List[Dict], words: List[Dict], src_lang: str | None,
+                    sent_base: int = 0) -> List[Tuple[str, List[Dict], Union[List[Dict], CueTable]]]:
+    """(lang, items, words) sets to insert, translating first when STT detected another language."""
+    # If we transcribed in another language, translate to requested
+    if TRANSLATE_ENABLED and src_lang and src_lang.lower() != lang.lower():
+        t_items = translate_items(items, target_lang=lang, source_lang=src_lang)
+        outputs = [(lang, t_items, CueTable.project_translated(t_items, sent_base))]
+        if STORE_SOURCE_LANG:
+            outputs.append((src_lang, items, words or []))
+        return outputs
+    return [(lang, items, words or [])]
+
+
+def group_outputs(ctx: Dict, outputs: List[Tuple[str, List[Dict], Union[List[Dict], CueTable]]]
+                  ) -> List[Tuple[str, List[Dict], Union[List[Dict], CueTable]]]:
+    """outputs without the languages another job of ctx's group writes, so a
+    language never gets a mix of caption rows and STT rows."""
+    group = ctx.get("group")
+    if group is None:
+        return outputs
+    return [o for o in outputs if group.may_write(o[0], ctx)]
+
+
+def write_outputs(video_id: str, outputs: List[Tuple[str, List[Dict], Union[List[Dict], CueTable]]],
+                  sent_base: int = 0, complete: bool = True) -> None:
+    """Upsert each output; complete=True means the outputs are whole
+    transcripts, so rows past their end left by an earlier run are deleted."""
+    for out_lang, out_items, out_words in outputs:
+        insert_subtitles(video_id, out_lang, out_items, sent_base)
+        insert_subtitle_words(video_id, out_lang, out_words)
+        if complete:
+            delete_cues_from(video_id, out_lang, sent_base + len(out_items))
+
+
+def _patch_job_info(job_id: str, fields: Dict) -> None:
+    """Best effort: informational columns must never fail a job."""
+    try:
+        r = http().patch(
+            rest("/subtitle_jobs"),
+            params={"id": f"eq.{job_id}"},
+            json=dict(fields, updated_at=now_utc_iso()),
+            headers=auth_headers(),
+            timeout=10,
+        )
+        r.raise_for_status()
+    except Exception as e:
+        print(f"Job info update failed for job {job_id} ({', '.join(fields)}): {e}")
+
+
+def update_job_progress(job_id: str, percent: float) -> None:
+    _patch_job_info(job_id, {"progress": round(percent, 1)})
+
+
+def record_stt_tier(job_id: str, tier: str) -> None:
+    _patch_job_info(job_id, {"stt_tier": tier})
+
+
+class ResultStreamer:
+    """Writes STT output in batches while decoding continues.
+
+    add() takes items plus words whose sent_index refers to those items;
+    every STREAM_FLUSH_SEGMENTS items or STREAM_FLUSH_SECONDS the batch is
+    translated if needed, upserted with global sent_index values, and job
+    progress is published as a share of the audio duration. Only the
+    current batch is held in memory.
+    """
+
+    def __init__(self, video_id: str, lang: str, job_id: Optional[str], duration: Optional[float]):
+        self.video_id = video_id
+        self.lang = lang
+        self.job_id = job_id
+        self.duration = duration
+        self.n_items = 0
+        self.src_lang: Optional[str] = None
+        self._items: List[Dict] = []
+        self._words: List[Dict] = []
+        self._position = 0.0
+        self._last_flush = time.monotonic()
+        self.speech_map: Optional[SpeechMap] = None
+        self.ctx: Optional[Dict] = None
+        self.langs: set = set()
+
+    def add(self, items: List[Dict], words: List[Dict], src_lang: Optional[str], position: float) -> None:
+        if self.speech_map is not None:
+            items, words = self.speech_map.remap(items), self.speech_map.remap(words)
+        base = self.n_items + len(self._items)
+        self._words.extend(dict(w, sent_index=w["sent_index"] + base) for w in words)
+        self._items.extend(items)
+        self.src_lang = self.src_lang or src_lang
+        self._position = max(self._position, position)
+        if len(self._items) >= STREAM_FLUSH_SEGMENTS or time.monotonic() - self._last_flush >= STREAM_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._items:
+            return
+        outputs = prepare_outputs(self.lang, self._items, self._words, self.src_lang, sent_base=self.n_items)
+        if self.ctx is not None:
+            outputs = group_outputs(self.ctx, outputs)
+        write_outputs(self.video_id, outputs, sent_base=self.n_items, complete=False)
+        self.langs.update(o[0] for o in outputs)
+        self.n_items += len(self._items)
+        self._items, self._words = [], []
+        if self.job_id and self.duration:
+            update_job_progress(self.job_id, min(100.0, 100.0 * self._position / self.duration))
+
+    def finish(self) -> None:
+        """Flush the last batch and delete rows past the end of the transcript."""
+        self.flush()
+        for lang in self.langs:
+            delete_cues_from(self.video_id, lang, self.n_items)
+
+
+class JobGroup:
+    """Jobs of one video in flight on this worker, one context per language.
+
+    Jobs for a language already in flight are attached to its context as
+    duplicates and finished with its outcome. once() runs work shared by the
+    languages (video info, source-language STT) a single time and hands
+    every caller the same result or exception. may_write() decides which
+    job writes the rows of a language.
+    """
+
+    def __init__(self, video_id: str):
+        self.video_id = video_id
+        self.lock = threading.Lock()
+        self.ctxs: Dict[str, Dict] = {}
+        self._results: Dict[object, Future] = {}
+        self._writers: Dict[str, Dict] = {}
+
+    def once(self, key, fn: Callable[[], object]):
+        with self.lock:
+            fut = self._results.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._results[key] = Future()
+        if leader:
+            try:
+                fut.set_result(fn())
+            except Exception as e:
+                fut.set_exception(e)
+        return fut.result()
+
+    def may_write(self, lang: str, ctx: Dict) -> bool:
+        """Whether ctx may write rows for lang. The job requesting lang always
+        may; other jobs (STORE_SOURCE_LANG rows) only while no job for lang
+        has joined the group, and only the first of them to ask."""
+        lang = lang.lower()
+        with self.lock:
+            if ctx["lang"].lower() == lang:
+                self._writers[lang] = ctx
+                return True
+            if lang in self.ctxs:
+                return False
+            return self._writers.setdefault(lang, ctx) is ctx
+
+    def multilingual(self) -> bool:
+        with self.lock:
+            return len(self.ctxs) > 1
+
+    def started(self, key) -> bool:
+        with self.lock:
+            return key in self._results
+
+
+_GROUPS: Dict[str, JobGroup] = {}
+_GROUPS_LOCK = threading.Lock()
+
+
+def attach_job(job: Dict) -> Optional[Dict]:
+    """Context for a claimed job, or None when it joined an in-flight job as a duplicate."""
+    lang_key = job["lang"].lower()
+    with _GROUPS_LOCK:
+        group = _GROUPS.setdefault(job["video_id"], JobGroup(job["video_id"]))
+        with group.lock:
+            ctx = group.ctxs.get(lang_key)
+            if ctx is not None:
+                print(f"Job {job['id']} duplicates in-flight job {ctx['job']['id']} ({job['video_id']} {job['lang']})")
+                ctx["duplicates"].append(job)
+                ctx["lease"].add(job["id"])
+                return None
+            ctx = new_job_context(job["video_id"], job["lang"], job)
+            ctx["group"] = group
+            ctx["duplicates"] = []
+            ctx["lease"] = LeaseHeartbeat(job["id"]).__enter__()
+            group.ctxs[lang_key] = ctx
+    print(f"Processing job {job['id']} {job['video_id']} {job['lang']} (worker {WORKER_ID})")
+    return ctx
+
+
+def detach_job(ctx: Dict) -> List[Dict]:
+    """Take ctx out of its group; returns the duplicate jobs to finish with it."""
+    group = ctx["group"]
+    with _GROUPS_LOCK:
+        with group.lock:
+            if group.ctxs.get(ctx["lang"].lower()) is ctx:
+                del group.ctxs[ctx["lang"].lower()]
+            dups, ctx["duplicates"] = ctx["duplicates"], []
+            if not group.ctxs and _GROUPS.get(group.video_id) is group:
+                del _GROUPS[group.video_id]
+    return dups
+
+
+# --- Job stages ---
+# A job moves through these stages as a context dict: video_id, lang, job (the
+# claimed row, None in single-shot), then info/items/words/src_lang/audio/
+# outputs as stages fill them in. A stage that raises sets ctx["error"] and
+# the remaining stages are skipped.
+
+def stage_fetch_captions(ctx: Dict) -> None:
+    video_id, lang = ctx["video_id"], ctx["lang"]
+    cached = ARTIFACT_CACHE.get_json("captions", video_id, {"lang": lang})
+    if cached:
+        print("Captions found in artifact cache. Parsing captions...")
+        # Entries cached before "auto" was stored were always deduplicated.
+        ctx["items"] = load_caption_items(cached["text"], cached["ext"], cached.get("auto", True))
+        if ctx["items"]:
+            return
+    group = ctx.get("group")
+    # Prefer yt-dlp subtitle fetch for better compatibility
+    with _IO_SLOTS:
+        if group is not None:
+            ctx["info"] = group.once("info", lambda: extract_video_info(video_id))
+        else:
+            ctx["info"] = extract_video_info(video_id)
+        caps = fetch_captions_via_ytdlp(ctx["info"], lang)
+    if caps:
+        print("Subtitles via yt-dlp found. Parsing captions...")
+        ctx["items"] = load_caption_items(*caps)
+    if not ctx.get("items"):
+        print("Trying public CC (timedtext)...")
+        with _IO_SLOTS:
+            vtt = fetch_youtube_vtt(video_id, lang)
+        if vtt:
+            print("CC via timedtext. Parsing VTT...")
+            # timedtext without kind=asr only serves manual tracks
+            ctx["items"] = load_caption_items(vtt)
+            caps = (vtt, "vtt", False)
+    if ctx.get("items"):
+        ARTIFACT_CACHE.put_json("captions", video_id, {"lang": lang}, {"text": caps[0], "ext": caps[1], "auto": caps[2]})
+
+
+def _restore_transcript(ctx: Dict) -> bool:
+    """Reuse a cached STT result in the job language or the video's own language."""
+    info = ctx.get("info") or {}
+    langs = [ctx["lang"]]
+    if info.get("language") and info["language"].lower() != ctx["lang"].lower():
+        langs.append(info["language"])
+    tiers = [parse_tier(t) for t in STT_TIERS] or [None]
+    for stt_lang in langs:
+        for tier in tiers:
+            with use_stt_tier(tier):
+                params = transcript_cache_params(stt_lang)
+            cached = ARTIFACT_CACHE.get_json("transcript", ctx["video_id"], params)
+            if cached and cached.get("items"):
+                break
+        if cached and cached.get("items"):
+            print(f"Transcript found in artifact cache (src_lang={cached.get('src_lang')}); skipping STT")
+            ctx["items"], ctx["words"], ctx["src_lang"] = cached["items"], cached.get("words"), cached.get("src_lang")
+            return True
+    return False
+
+
+def stage_acquire_audio(ctx: Dict) -> None:
+    if ctx.get("items"):
+        return
+    if DISABLE_STT:
+        raise RuntimeError("No CC and STT is disabled (set DISABLE_STT=0 to enable)")
+    if _restore_transcript(ctx):
+        return
+    group = ctx.get("group")
+    if group is not None and (group.multilingual() or group.started("stt")):
+        # Several languages of this video need STT: whichever reaches the
+        # transcribe stage first downloads and transcribes for all of them.
+        ctx["shared_stt"] = True
+        return
+    _acquire_audio_into(ctx)
+
+
+def _acquire_audio_into(ctx: Dict) -> None:
+    print("No CC or empty. Falling back to STT (yt-dlp + Whisper)...")
+    if CHECKPOINT_DIR:
+        ctx["checkpoint"] = JobCheckpoint(CHECKPOINT_DIR, ctx["video_id"])
+    audio_params = {"max_seconds": acquire_seconds()}
+    ctx["audio"] = ARTIFACT_CACHE.get("audio", ctx["video_id"], audio_params)
+    if ctx["audio"] is not None:
+        print("Audio found in artifact cache")
+        return
+    if ctx.get("checkpoint") is not None:
+        ctx["audio"] = ctx["checkpoint"].load_audio()
+        if ctx["audio"] is not None:
+            print("Audio restored from checkpoint")
+            return
+    ctx["tmpdir"] = tempfile.mkdtemp(prefix="subtitle-worker-")
+    with _IO_SLOTS:
+        ctx["audio"] = acquire_audio(ctx["video_id"], ctx["tmpdir"], info=ctx.get("info"))
+    if ARTIFACT_CACHE.enabled:
+        ARTIFACT_CACHE.put("audio", ctx["video_id"], audio_params, audio_to_pcm(ctx["audio"]))
+    if ctx.get("checkpoint") is not None:
+        ctx["audio"] = ctx["checkpoint"].save_audio(ctx["audio"])
+        _cleanup_tmpdir(ctx)
+
+
+def stage_trim_speech(ctx: Dict) -> None:
+    if not SPEECH_TRIM or ctx.get("audio") is None or decode_audio is None:
+        return
+    samples = audio_to_array(ctx["audio"])
+    trimmed, speech_map = trim_to_speech(samples, MAX_AUDIO_SECONDS)
+    if speech_map is None:
+        # The audio was acquired at SPEECH_TRIM_ACQUIRE_FACTOR times the
+        # budget; without speech regions fall back to the plain budget.
+        limit = MAX_AUDIO_SECONDS * SAMPLE_RATE if MAX_AUDIO_SECONDS else len(samples)
+        if len(samples) <= limit:
+            print("Speech trim: no speech detected; transcribing the full audio")
+            return
+        print(f"Speech trim: no speech detected; transcribing the first {MAX_AUDIO_SECONDS}s")
+        ctx["audio"] = array_to_pcm(samples[:limit])
+        _cleanup_tmpdir(ctx)
+        return
+    print(f"Speech trim: {len(samples) / SAMPLE_RATE:.0f}s -> {len(trimmed) / SAMPLE_RATE:.0f}s of speech "
+          f"in {len(speech_map.orig_starts)} regions")
+    ctx["audio"] = array_to_pcm(trimmed)
+    ctx["speech_map"] = speech_map
+    _cleanup_tmpdir(ctx)
+
+
+def _nested_span_seconds(ctx: Dict) -> float:
+    return sum(v for k, v in ctx.get("spans", {}).items() if k != "stt")
+
+
+def _transcribe_audio(ctx: Dict, stt_lang: str, sink: Optional[ResultStreamer] = None) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
+    """Pick the STT tier (and, with STT_LANGUAGE_ID, the language), then
+    transcribe ctx["audio"] and cache the result in original video time.
+    With a sink the segments are streamed instead of returned. The caller
+    holds an STT slot."""
+    tier = None
+    if os.environ.get("STT_ENGINE", "faster_whisper").lower() != "openai":
+        if STT_LANGUAGE_ID:
+            stt_lang = identify_language(ctx["audio"], stt_lang)
+        tier = select_stt_tier(ctx)
+    duration = audio_duration_seconds(ctx["audio"])
+    # Spans nested in "stt" (model_load, and db_write/translate when
+    # streaming) are not decode time; leave them out of the RTF.
+    span_ctx = getattr(_CURRENT_JOB, "ctx", None) or ctx
+    nested_before = _nested_span_seconds(span_ctx)
+    t0 = time.monotonic()
+    with use_stt_tier(tier), span("stt"):
+        items, src_lang, words = transcribe_with_whisper(ctx["audio"], stt_lang, sink=sink,
+                                                         checkpoint=ctx.get("checkpoint"))
+    took = max(0.0, time.monotonic() - t0 - (_nested_span_seconds(span_ctx) - nested_before))
+    if duration:
+        ctx["audio_seconds"] = duration
+        ctx["stt_rtf"] = round(took / duration, 4)
+        METRICS.inc("worker_audio_seconds_total", duration)
+        METRICS.observe("worker_stt_rtf", took / duration, buckets=_RTF_BUCKETS, model=fw_settings()[0] if not tier else tier[0])
+        if tier:
+            record_rtf(tier[0], took, duration)
+    with use_stt_tier(tier):
+        if ctx.get("speech_map") is not None and sink is None:
+            items, words = ctx["speech_map"].remap(items), ctx["speech_map"].remap(words)
+        src_lang = src_lang or stt_lang or None
+        if items:
+            ARTIFACT_CACHE.put_json(
+                "transcript", ctx["video_id"], transcript_cache_params(src_lang or ctx["lang"]),
+                {"items": items, "words": words, "src_lang": src_lang},
+            )
+    return items, src_lang, words
+
+
+def _shared_transcript(ctx: Dict) -> Tuple[List[Dict], Optional[str], Optional[List[Dict]]]:
+    """STT once for every language of ctx's group, in the video's own language
+    when yt-dlp reports it (auto-detected otherwise), so each job translates
+    from the source."""
+    stt_lang = (ctx.get("info") or {}).get("language") or ""
+    try:
+        _acquire_audio_into(ctx)
+        stage_trim_speech(ctx)
+        with _STT_SLOTS:
+            return _transcribe_audio(ctx, stt_lang)
+    finally:
+        ctx["audio"] = None
+        _cleanup_tmpdir(ctx)
+
+
+def stage_transcribe(ctx: Dict) -> None:
+    if ctx.get("shared_stt"):
+        ctx["items"], ctx["src_lang"], ctx["words"] = ctx["group"].once("stt", lambda: _shared_transcript(ctx))
+        return
+    if ctx.get("items") or ctx.get("audio") is None:
+        return
+    streaming = STREAM_RESULTS and os.environ.get("STT_ENGINE", "faster_whisper").lower() != "openai"
+    with _STT_SLOTS:
+        if streaming:
+            job = ctx.get("job")
+            sink = ResultStreamer(ctx["video_id"], ctx["lang"], job["id"] if job else None,
+                                  audio_duration_seconds(ctx["audio"]))
+            sink.speech_map = ctx.get("speech_map")
+            sink.ctx = ctx
+            _, ctx["src_lang"], _ = _transcribe_audio(ctx, ctx["lang"], sink=sink)
+            sink.finish()
+            print(f"Transcription done: {sink.n_items} segments; src_lang={ctx['src_lang']}")
+            if not sink.n_items:
+                raise RuntimeError("No subtitles from CC nor STT")
+            ctx["streamed"] = sink.n_items
+        else:
+            ctx["items"], ctx["src_lang"], ctx["words"] = _transcribe_audio(ctx, ctx["lang"])
+    ctx["audio"] = None
+    _cleanup_tmpdir(ctx)
+
+
+def stage_translate(ctx: Dict) -> None:
+    if ctx.get("streamed"):
+        return
+    items = ctx.get("items")
+    if not items:
+        raise RuntimeError("No subtitles from CC nor STT")
+    words = ctx.get("words")
+    if words is None:
+        words = CueTable.split_words(items)
+    ctx["outputs"] = prepare_outputs(ctx["lang"], items, words, ctx.get("src_lang"))
+
+
+def stage_write(ctx: Dict) -> None:
+    if ctx.get("streamed"):
+        return
+    outputs = ctx["outputs"]
+    outputs = group_outputs(ctx, outputs)
+    write_outputs(ctx["video_id"], outputs)
+    if EXPORT_DIR:
+        for out_lang, out_items, out_words in outputs:
+            try:
+                export_transcript(ctx["video_id"], out_lang, out_items, out_words)
+            except Exception as e:
+                print(f"Transcript export failed ({out_lang}): {e}")
+
+
+JOB_STAGES: List[Tuple[str, Callable[[Dict], None]]] = [
+    ("fetch", stage_fetch_captions),
+    ("audio", stage_acquire_audio),
+    ("trim", stage_trim_speech),
+    ("transcribe", stage_transcribe),
+    ("translate", stage_translate),
+    ("write", stage_write),
+]
+
+
+def _cleanup_tmpdir(ctx: Dict) -> None:
+    tmp = ctx.pop("tmpdir", None)
+    if tmp:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run_stage(name: str, fn: Callable[[Dict], None], ctx: Dict) -> None:
+    if ctx.get("error") is not None:
+        return
+    _CURRENT_JOB.ctx = ctx
+    t0 = time.perf_counter()
+    try:
+        fn(ctx)
+    except Exception as e:
+        ctx["error"] = e
+        ctx["failed_stage"] = name
+    finally:
+        took = time.perf_counter() - t0
+        _CURRENT_JOB.ctx = None
+        ctx.setdefault("stages", {})[name] = round(took, 4)
+        METRICS.observe("worker_stage_seconds", took, stage=name)
+
+
+def log_job_summary(ctx: Dict, status: str) -> None:
+    """One JSON line per job with its stage/span timings and counts."""
+    job = ctx.get("job") or {}
+    summary = {
+        "event": "job",
+        "job_id": job.get("id"),
+        "video_id": ctx["video_id"],
+        "lang": ctx["lang"],
+        "status": status,
+        "failed_stage": ctx.get("failed_stage"),
+        "error": str(ctx["error"])[:200] if ctx.get("error") is not None else None,
+        "duplicates": len(ctx.get("duplicates") or []),
+        "total_s": round(time.monotonic() - ctx["started"], 3),
+        "queue_wait_s": ctx.get("queue_wait_s"),
+        "stages": ctx.get("stages", {}),
+        "spans": {k: round(v, 4) for k, v in ctx.get("spans", {}).items()},
+        "items": ctx.get("streamed") or len(ctx.get("items") or []),
+        "rows_written": ctx.get("rows_written", 0),
+        "audio_seconds": ctx.get("audio_seconds"),
+        "stt_rtf": ctx.get("stt_rtf"),
+        "stt_tier": ctx.get("stt_tier"),
+    }
+    print(json.dumps(summary, ensure_ascii=False))
+
+
+def new_job_context(video_id: str, lang: str, job: Optional[Dict] = None) -> Dict:
+    ctx = {"video_id": video_id, "lang": lang, "job": job, "error": None, "done": threading.Event(),
+           "started": time.monotonic()}
+    if job and job.get("created_at"):
+        try:
+            created = datetime.fromisoformat(job["created_at"].replace("Z", "+00:00"))
+            ctx["queue_wait_s"] = round((datetime.now(timezone.utc) - created).total_seconds(), 3)
+            METRICS.observe("worker_queue_wait_seconds", ctx["queue_wait_s"])
+        except ValueError:
+            pass
+    return ctx
+
+
+def finish_job(ctx: Dict) -> None:
+    """Report the outcome, release the lease and temp files, wake waiters.
+
+    The checkpoint is dropped only on success; a failed job keeps it for the
+    next attempt.
+    """
+    _cleanup_tmpdir(ctx)
+    job = ctx.get("job")
+    err = ctx.get("error")
+    checkpoint = ctx.pop("checkpoint", None)
+    if checkpoint is not None and err is None:
+        checkpoint.clear()
+    n_items = ctx.get("streamed") or len(ctx.get("items") or [])
+    dups = detach_job(ctx) if ctx.get("group") is not None else []
+    ctx["duplicates"] = dups
+    status = "error" if err else "done"
+    METRICS.inc("worker_jobs_total", 1 + len(dups), status=status)
+    log_job_summary(ctx, status)
+    try:
+        if job is None:
+            print(f"Single-shot error: {err}" if err else f"Single-shot done: {n_items} items")
+        elif err:
+            for j in [job] + dups:
+                update_job(j["id"], "error", str(err))
+            print(f"Job error ({ctx.get('failed_stage')}): {err}")
+        else:
+            for j in [job] + dups:
+                if ctx.get("streamed"):
+                    update_job_progress(j["id"], 100.0)
+                update_job(j["id"], "done")
+            print(f"Job done: {n_items} items" + (f" (+{len(dups)} duplicate job(s))" if dups else ""))
+    except Exception as e:
+        print(f"Failed to record job result: {e}")
+    finally:
+        lease = ctx.pop("lease", None)
+        if lease is not None:
+            lease.__exit__(None, None, None)
+        on_done = ctx.pop("on_done", None)
+        if on_done is not None:
+            on_done()
+        ctx["done"].set()
+
+
+def run_job_stages(ctx: Dict) -> None:
+    """Run every stage for one job in the calling thread."""
+    for name, fn in JOB_STAGES:
+        run_stage(name, fn, ctx)
+    finish_job(ctx)
+
+
+class JobPipeline:
+    """Job stages connected by bounded queues, each with its own threads.
+
+    While job N is in faster-whisper, job N+1 can be downloading and job N-1
+    writing rows. A full queue blocks the stage before it, which bounds the
+    number of jobs held in memory.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Dict], None], int]], queue_size: int):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        for i, (name, fn, workers) in enumerate(stages):
+            for w in range(workers):
+                threading.Thread(target=self._run, args=(i,), name=f"{name}-{w}", daemon=True).start()
+
+    def _run(self, i: int) -> None:
+        name, fn, _ = self.stages[i]
+        q = self.queues[i]
+        while True:
+            ctx = q.get()
+            run_stage(name, fn, ctx)
+            if i + 1 < len(self.queues):
+                self.queues[i + 1].put(ctx)
+            else:
+                finish_job(ctx)
+
+    def submit(self, ctx: Dict) -> None:
+        self.queues[0].put(ctx)
+
+
+_PIPELINE: Optional[JobPipeline] = None
+_PIPELINE_LOCK = threading.Lock()
+
+
+def job_pipeline() -> JobPipeline:
+    global _PIPELINE
+    with _PIPELINE_LOCK:
+        if _PIPELINE is None:
+            workers = {
+                "fetch": IO_CONCURRENCY,
+                "audio": IO_CONCURRENCY,
+                "trim": STT_CONCURRENCY,
+                "transcribe": STT_CONCURRENCY,
+                "translate": PIPELINE_TRANSLATE_WORKERS,
+                "write": PIPELINE_WRITE_WORKERS,
+            }
+            _PIPELINE = JobPipeline([(n, fn, workers[n]) for n, fn in JOB_STAGES], PIPELINE_QUEUE_SIZE)
+        return _PIPELINE
+
+
+def process_one_job() -> bool:
+    jobs = claim_jobs()
+    if not jobs:
+        return False
+    ctxs = [c for c in map(attach_job, jobs) if c is not None]
+    for ctx in ctxs:
+        run_job_stages(ctx)
+    return True
+
+
+def pipeline_feeder() -> None:
+    """Claim jobs into the pipeline while fewer than PIPELINE_MAX_JOBS are in flight."""
+    pipeline = job_pipeline()
+    in_flight = threading.BoundedSemaphore(PIPELINE_MAX_JOBS)
+    while True:
+        in_flight.acquire()
+        try:
+            jobs = claim_jobs()
+        except Exception as e:
+            print(f"Fatal loop error: {e}")
+            jobs = []
+        if not jobs:
+            in_flight.release()
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+        ctxs = [c for c in map(attach_job, jobs) if c is not None]
+        if not ctxs:
+            in_flight.release()
+            continue
+        # Jobs claimed together take one in-flight slot, freed when the last finishes.
+        remaining = [len(ctxs)]
+        lock = threading.Lock()
+
+        def one_done(remaining=remaining, lock=lock) -> None:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                in_flight.release()
+
+        for ctx in ctxs:
+            ctx["on_done"] = one_done
+            pipeline.submit(ctx)
+
+
+def process_single(video_id: str, lang: str) -> None:
+    print(f"Single-shot: {video_id} {lang}")
+    ctx = new_job_context(video_id, lang)
+    job_pipeline().submit(ctx)
+    ctx["done"].wait()
+
+
+def main():
+    if not SUPABASE_URL or not SERVICE_ROLE:
+        raise RuntimeError("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+    if SINGLE_VIDEO_ID and SINGLE_LANG:
+        print("Worker started (single-shot mode)")
+        process_single(SINGLE_VIDEO_ID, SINGLE_LANG)
+        return
+    prune_checkpoints(CHECKPOINT_DIR, CHECKPOINT_TTL_HOURS)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if FW_PRELOAD and os.environ.get("STT_ENGINE", "faster_whisper").lower() != "openai" and not DISABLE_STT:
+        MODEL_REGISTRY.preload()
+    if PIPELINE_MODE:
+        print(f"Worker started (REST pipeline mode, id={WORKER_ID}, max_jobs={PIPELINE_MAX_JOBS}, "
+              f"io={IO_CONCURRENCY}, stt={STT_CONCURRENCY})")
+        threading.Thread(target=pipeline_feeder, name="feeder", daemon=True).start()
+    else:
+        print(f"Worker started (REST mode, id={WORKER_ID}, slots={WORKER_CONCURRENCY}, "
+              f"io={IO_CONCURRENCY}, stt={STT_CONCURRENCY})")
+        for slot in range(WORKER_CONCURRENCY):
+            threading.Thread(target=worker_loop, name=f"slot-{slot}", daemon=True).start()
+    # Main thread reclaims jobs abandoned by crashed workers.
+    while True:
+        try:
+            requeue_expired_leases()
+        except Exception as e:
+            print(f"Lease reaper error: {e}")
+        time.sleep(HEARTBEAT_SECONDS)
+
+
+def worker_loop() -> None:
     while True:
         try:
             did = process_one_job()
@@ -32,4 +32,4 @@ if [ -f .env ]; then
   set +a
 fi
 
-python tools/diagnose.py
+python tools/diagnose.py "$@"
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for the worker. Results are printed as JSON.
+
+    python tools/bench.py parse --cues 50000
+    python tools/bench.py stt --audio speech.wav --clips 8 --clip-seconds 90
+    python tools/bench.py pipeline --sizes 100,1000,10000,100000 --jobs 50 --out bench.json
+    python tools/bench.py check   # parser regressions on tools/samples/
+
+The pipeline benchmark runs offline: yt-dlp and timedtext are stubbed, the
+translation engine is replaced by a trivial function (so only worker
+overhead is timed) and writes go to tools/mock_postgrest.py.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLS_DIR, ".."))
+sys.path.insert(0, TOOLS_DIR)
+import main  # noqa: E402
+from mock_postgrest import MockPostgREST  # noqa: E402
+
+
+def _ts(sec: float, sep: str = ".") -> str:
+    h, rem = divmod(sec, 3600)
+    m, s = divmod(rem, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}".replace(".", sep)
+
+
+def synth_vtt(n: int) -> str:
+    out = ["WEBVTT", "Kind: captions", "Language: en", ""]
+    for i in range(n):
+        t = i * 2.0
+        out += [f"{_ts(t)} --> {_ts(t + 2.0)} align:start position:0%",
+                f"caption number {i} with a few <c>more</c> words", ""]
+    return "\n".join(out)
+
+
+def synth_rolling_vtt(n: int) -> str:
+    """YouTube auto-caption style: each cue repeats the previous line above the
+    new one with <c> word timings, followed by a 10 ms snapshot cue."""
+    out = ["WEBVTT", "Kind: captions", "Language: en", ""]
+    prev = ""
+    for i in range(n):
+        t = i * 2.0
+        words = [f"word{i}_{k}" for k in range(5)]
+        timed = words[0] + "".join(f"<{_ts(t + 0.3 * k)}><c> {w}</c>" for k, w in enumerate(words[1:], 1))
+        plain = " ".join(words)
+        out += [f"{_ts(t)} --> {_ts(t + 2.0)} align:start position:0%", prev or " ", timed, "",
+                f"{_ts(t + 2.0)} --> {_ts(t + 2.01)} align:start position:0%", plain, " ", ""]
+        prev = plain
+    return "\n".join(out)
+
+
+def synth_speech(seconds: float, seed: int = 0):
+    """Speech-like 16 kHz float32 mono: voiced syllables (harmonic tone with
+    a moving pitch plus noise, 80-300 ms) in phrases separated by pauses."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    sr = main.SAMPLE_RATE
+    out = np.zeros(int(seconds * sr), dtype=np.float32)
+    pos = 0
+    while pos < len(out):
+        for _ in range(int(rng.integers(3, 12))):  # one phrase
+            n = int(rng.uniform(0.08, 0.3) * sr)
+            t = np.arange(n) / sr
+            f0 = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * math.pi * 3 * t))
+            phase = 2 * math.pi * np.cumsum(f0) / sr
+            voiced = sum(np.sin(h * phase) / h for h in range(1, 8))
+            syl = (voiced + 0.05 * rng.standard_normal(n)) * np.hanning(n) * 0.3
+            end = min(pos + n, len(out))
+            out[pos:end] = syl[: end - pos]
+            pos = end + int(rng.uniform(0.02, 0.1) * sr)
+            if pos >= len(out):
+                break
+        pos += int(rng.uniform(0.3, 2.0) * sr)  # pause between phrases
+    return out
+
+
+def synth_srt(n: int) -> str:
+    out = []
+    for i in range(n):
+        t = i * 2.0
+        out += [str(i + 1), f"{_ts(t, ',')} --> {_ts(t + 2.0, ',')}", f"caption number {i} with a few more words", ""]
+    return "\n".join(out)
+
+
+def synth_json3(n: int) -> str:
+    events = [{"tStartMs": i * 2000, "dDurationMs": 2000,
+               "segs": [{"utf8": f"caption number {i}"}, {"utf8": " with a few more words", "tOffsetMs": 800}]}
+              for i in range(n)]
+    return json.dumps({"events": events})
+
+
+def webvtt_baseline(vtt_text: str):
+    """The parser the worker used before: temp file + webvtt-py."""
+    import webvtt
+    with tempfile.NamedTemporaryFile("w+", suffix=".vtt", delete=False) as f:
+        f.write(vtt_text)
+        path = f.name
+    try:
+        items = []
+        for c in webvtt.read(path):
+            start = main._timestamp_to_seconds(c.start)
+            end = main._timestamp_to_seconds(c.end)
+            text = c.text.strip()
+            if text:
+                items.append({"start": start, "duration": max(0.0, end - start), "text": text})
+        return items
+    finally:
+        os.remove(path)
+
+
+def _time(fn, *args, repeat: int = 3):
+    best = None
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        took = time.perf_counter() - t0
+        best = took if best is None else min(best, took)
+    return best, out
+
+
+def bench_parse(args) -> dict:
+    n = args.cues
+    results = {}
+    for name, text, fmt in (
+        ("vtt", synth_vtt(n), "vtt"),
+        ("vtt_bytes", synth_vtt(n).encode("utf-8"), "vtt"),
+        ("srt", synth_srt(n), "srt"),
+        ("json3", synth_json3(n), "json3"),
+    ):
+        took, items = _time(main.parse_vtt_to_items, text, fmt, repeat=args.repeat)
+        results[name] = {"cues": len(items), "seconds": round(took, 4), "cues_per_sec": round(len(items) / took)}
+    try:
+        took, items = _time(webvtt_baseline, synth_vtt(n), repeat=args.repeat)
+        results["webvtt_py_baseline"] = {"cues": len(items), "seconds": round(took, 4),
+                                         "cues_per_sec": round(len(items) / took)}
+        results["speedup_vs_webvtt_py"] = round(results["webvtt_py_baseline"]["seconds"] / results["vtt"]["seconds"], 2)
+    except ImportError:
+        results["webvtt_py_baseline"] = "skipped (pip install webvtt-py to compare)"
+    return {"bench": "parse", "input_cues": n, "results": results}
+
+
+def bench_stt(args) -> dict:
+    """Realtime factor (processing seconds per audio second) of the sequential
+    path against STT_MODE=batched, per clip and with all clips in one batch."""
+    if main.decode_audio is None:
+        raise SystemExit("faster-whisper is not installed")
+    if args.model:
+        os.environ["FW_MODEL"] = args.model
+    main.FW_BATCH_SIZE = args.batch_size
+    main.STT_PROCESSES = 1
+    audio = main.audio_to_array(args.audio)
+    n = int(args.clip_seconds * main.SAMPLE_RATE)
+    clips = [audio[i * n:(i + 1) * n] for i in range(args.clips) if len(audio[i * n:(i + 1) * n])]
+    if len(clips) < args.clips:
+        clips = [audio[:n]] * args.clips  # short input: reuse the first clip
+    audio_s = sum(len(c) for c in clips) / main.SAMPLE_RATE
+    main.MODEL_REGISTRY.get(*main.fw_settings())  # load time is not part of the RTF
+
+    def sequential():
+        main.STT_MODE = "sequential"
+        return [main.transcribe_with_whisper((c * 32767).astype("int16").tobytes(), args.lang) for c in clips]
+
+    def batched_per_clip():
+        return [main.transcribe_batched([c], args.lang)[0] for c in clips]
+
+    def batched_cross_clip():
+        return main.transcribe_batched(clips, args.lang)
+
+    results = {}
+    took_seq = None
+    for name, fn in (("sequential", sequential), ("batched", batched_per_clip), ("batched_cross_job", batched_cross_clip)):
+        took, out = _time(fn, repeat=args.repeat)
+        results[name] = {"seconds": round(took, 2), "rtf": round(took / audio_s, 4),
+                         "segments": sum(len(items) for items, _, _ in out)}
+        if took_seq is None:
+            took_seq = took
+        else:
+            results[name]["speedup"] = round(took_seq / took, 2)
+    return {"bench": "stt", "model": main.fw_settings()[0], "batch_size": args.batch_size,
+            "clips": len(clips), "audio_seconds": round(audio_s, 1), "results": results}
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=TOOLS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _rate(n: int, took: float) -> int:
+    return round(n / took) if took > 0 else 0
+
+
+def _fake_translate(lines, target_lang, source_lang=None):
+    return [f"[{target_lang}] {line}" for line in lines]
+
+
+class offline_worker:
+    """Points main at a fresh mock PostgREST, temp caches and stubbed sources."""
+
+    def __init__(self, vtt_for):
+        self.vtt_for = vtt_for
+
+    def __enter__(self) -> MockPostgREST:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mock = MockPostgREST().start()
+        self.saved = {k: getattr(main, k) for k in (
+            "SUPABASE_URL", "SERVICE_ROLE", "extract_video_info", "fetch_youtube_vtt", "_translate_lines_argos",
+            "_translate_lines_openai", "TRANSLATION_CACHE", "ARTIFACT_CACHE", "CHECKPOINT_DIR", "POLL_INTERVAL_SECONDS")}
+        main.SUPABASE_URL, main.SERVICE_ROLE = self.mock.url, "bench"
+        main.extract_video_info = lambda video_id: {"id": video_id, "language": "en", "duration": 600}
+        main.fetch_youtube_vtt = lambda video_id, lang: self.vtt_for(video_id, lang)
+        main._translate_lines_argos = main._translate_lines_openai = _fake_translate
+        main.TRANSLATION_CACHE = main.TranslationCache(os.path.join(self.tmp.name, "tm.sqlite3"), 1_000_000)
+        main.ARTIFACT_CACHE = main.ArtifactCache(os.path.join(self.tmp.name, "artifacts"), 4096, 24)
+        main.CHECKPOINT_DIR = ""
+        return self.mock
+
+    def __exit__(self, *exc) -> None:
+        for k, v in self.saved.items():
+            setattr(main, k, v)
+        self.mock.stop()
+        self.tmp.cleanup()
+
+
+def _bench_size(n: int, repeat: int) -> dict:
+    res = {}
+    for name, text in (("parse_vtt", synth_vtt(n)), ("parse_rolling_vtt", synth_rolling_vtt(n))):
+        took, items = _time(main.parse_vtt_to_items, text, "vtt", repeat=repeat)
+        res[name] = {"cues": len(items), "seconds": round(took, 4), "cues_per_sec": _rate(len(items), took)}
+    took, (norm, _) = _time(main.normalize_caption_items, items, repeat=repeat)
+    res["normalize_rolling"] = {"cues_in": len(items), "cues_out": len(norm), "seconds": round(took, 4),
+                                "cues_per_sec": _rate(len(items), took)}
+    items = main.parse_vtt_to_items(synth_vtt(n), "vtt")
+    took, words = _time(main.split_items_to_words, items, repeat=repeat)
+    res["split_items_to_words"] = {"words": len(words), "seconds": round(took, 4),
+                                   "cues_per_sec": _rate(len(items), took)}
+    took, table = _time(main.CueTable.split_words, items, repeat=repeat)
+    res["cue_table_split_words"] = {"words": len(table), "seconds": round(took, 4),
+                                    "cues_per_sec": _rate(len(items), took)}
+    with offline_worker(lambda v, l: None):
+        t0 = time.perf_counter()
+        main.translate_items(items, "ja", "en")
+        cold = time.perf_counter() - t0
+        took, _ = _time(main.translate_items, items, "ja", "en", repeat=repeat)
+        res["translate_items"] = {"cold_seconds": round(cold, 4), "warm_seconds": round(took, 4),
+                                  "cold_cues_per_sec": _rate(n, cold), "warm_cues_per_sec": _rate(n, took)}
+        took, _ = _time(main.insert_subtitles, "bench", "en", items, repeat=repeat)
+        res["insert_subtitles"] = {"rows": len(items), "seconds": round(took, 4), "rows_per_sec": _rate(len(items), took)}
+        took, _ = _time(main.insert_subtitle_words, "bench", "en", words, repeat=repeat)
+        res["insert_subtitle_words"] = {"rows": len(words), "seconds": round(took, 4),
+                                        "rows_per_sec": _rate(len(words), took)}
+    res["peak_rss_mb"] = peak_rss_mb()
+    return res
+
+
+def _bench_jobs(jobs: int, cues: int) -> dict:
+    """process_one_job over queued jobs. Even jobs have captions (rolling
+    timedtext). Odd jobs have none and find an English transcript in the
+    artifact cache, so they exercise translation to Japanese without STT."""
+    vtt = synth_rolling_vtt(cues)
+    transcript = {"items": main.parse_vtt_to_items(synth_vtt(cues), "vtt"), "words": None, "src_lang": "en"}
+    with offline_worker(lambda video_id, lang: vtt if video_id.startswith("cc") else None) as mock:
+        for i in range(jobs):
+            if i % 2:
+                main.ARTIFACT_CACHE.put_json("transcript", f"stt{i:05d}", main.transcript_cache_params("en"), transcript)
+                mock.seed_job(f"stt{i:05d}", "ja")
+            else:
+                mock.seed_job(f"cc{i:05d}", "en")
+        t0 = time.perf_counter()
+        done = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            while main.process_one_job():
+                done += 1
+        took = time.perf_counter() - t0
+        statuses = {}
+        for row in mock.tables.get("subtitle_jobs", []):
+            statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+        rows = sum(len(mock.tables.get(t, [])) for t in ("subtitles", "subtitle_words"))
+    n_jobs = sum(statuses.values())
+    return {"jobs": n_jobs, "claims": done, "cues_per_job": cues, "statuses": statuses, "rows_written": rows,
+            "seconds": round(took, 3), "jobs_per_min": round(n_jobs * 60 / took, 1) if took else 0,
+            "rest_requests": mock.requests, "peak_rss_mb": peak_rss_mb()}
+
+
+def _bench_audio(seconds: float, repeat: int) -> dict:
+    try:
+        audio = synth_speech(seconds)
+    except ImportError:
+        return {"skipped": "numpy is not installed"}
+    took, pcm = _time(main.array_to_pcm, audio, repeat=repeat)
+    res = {"audio_seconds": seconds, "array_to_pcm_seconds": round(took, 4)}
+    took, _ = _time(main.audio_to_array, pcm, repeat=repeat)
+    res["audio_to_array_seconds"] = round(took, 4)
+    if main.decode_audio is None:  # the faster-whisper import failed; VAD names are not defined
+        res["vad"] = "skipped (faster-whisper is not installed)"
+        return res
+    took, (speech, _) = _time(main.trim_to_speech, audio, None, repeat=repeat)
+    res["trim_to_speech"] = {"seconds": round(took, 4), "rtf": round(took / seconds, 5),
+                             "speech_ratio": round(len(speech) / len(audio), 3)}
+    took, clips = _time(main.plan_speech_clips, audio, repeat=repeat)
+    res["plan_speech_clips"] = {"seconds": round(took, 4), "clips": len(clips)}
+    return res
+
+
+def bench_pipeline(args) -> dict:
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    random.seed(0)
+    report = {"bench": "pipeline", "commit": _git_rev(), "python": platform.python_version(),
+              "platform": platform.platform(), "sizes": {}}
+    for n in sizes:
+        report["sizes"][str(n)] = _bench_size(n, args.repeat)
+    report["audio"] = _bench_audio(args.audio_seconds, args.repeat)
+    if args.jobs:
+        report["process_one_job"] = _bench_jobs(args.jobs, args.job_cues)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+# Regression samples: file -> expected (text, start, word starts) per
+# collapsed line from load_caption_items.
+SAMPLES_DIR = os.path.join(TOOLS_DIR, "samples")
+SAMPLE_EXPECTATIONS = {
+    # Auto captions: each caption run opens with a cue whose top line is " ".
+    "autocaption_rolling.vtt": [
+        ("hello everyone and welcome", 0.16, [0.16, 0.48, 0.8, 1.12]),
+        ("to the channel", 2.24, [2.24, 2.56, 2.88]),
+    ],
+}
+
+
+def check_samples(args) -> dict:
+    failures = []
+    for name, expected in SAMPLE_EXPECTATIONS.items():
+        with open(os.path.join(SAMPLES_DIR, name), "rb") as f:
+            with contextlib.redirect_stdout(io.StringIO()):
+                items = main.load_caption_items(f.read(), name.rsplit(".", 1)[-1], is_auto=True)
+        got = [(it["text"], round(it["start"], 3), [round(w["start"], 3) for w in it.get("words") or []])
+               for it in items]
+        if got != expected:
+            failures.append({"sample": name, "expected": expected, "got": got})
+    report = {"bench": "check", "samples": len(SAMPLE_EXPECTATIONS), "failures": failures}
+    if failures:
+        print(json.dumps(report, indent=2))
+        raise SystemExit(1)
+    return report
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Worker benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("parse", help="caption parser throughput")
+    p.add_argument("--cues", type=int, default=50000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(fn=bench_parse)
+    p = sub.add_parser("stt", help="faster-whisper realtime factor, sequential vs batched")
+    p.add_argument("--audio", required=True, help="audio file with speech (any format ffmpeg reads)")
+    p.add_argument("--clips", type=int, default=8, help="number of jobs to simulate")
+    p.add_argument("--clip-seconds", type=float, default=90)
+    p.add_argument("--lang", default="en")
+    p.add_argument("--model", default=None, help="FW_MODEL override")
+    p.add_argument("--batch-size", type=int, default=8)
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(fn=bench_stt)
+    p = sub.add_parser("pipeline", help="offline end-to-end worker benchmark (mock PostgREST, stubbed sources)")
+    p.add_argument("--sizes", default="100,1000,10000,100000", help="comma-separated cue counts")
+    p.add_argument("--jobs", type=int, default=50, help="videos queued for the process_one_job loop (0 skips)")
+    p.add_argument("--job-cues", type=int, default=600, help="cues per queued video")
+    p.add_argument("--audio-seconds", type=float, default=120)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--out", default=None, help="also write the JSON report to this file")
+    p.set_defaults(fn=bench_pipeline)
+    p = sub.add_parser("check", help="caption parser regressions on tools/samples/")
+    p.set_defaults(fn=check_samples)
+    args = ap.parse_args()
+    report = args.fn(args)
+    print(json.dumps(report, indent=2))
+    if getattr(args, "out", None):
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
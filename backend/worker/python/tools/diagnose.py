@@ -1,5 +1,28 @@
 #!/usr/bin/env python3
+"""Environment check for the worker.
+
+    python tools/diagnose.py          # imports, binaries and env vars
+    python tools/diagnose.py --perf   # benchmark this machine and write .env.tuned
+
+--perf measures ffmpeg decode speed, the faster-whisper realtime factor
+(RTF = processing seconds per audio second) for each model / compute type /
+thread count, Argos sentences per second and REST round-trip latency, then
+writes a recommended tuning to .env.tuned. main.py loads that file at
+startup without overriding variables that are already set.
+"""
 import os, subprocess, json, sys
+import argparse
+import math
+import statistics
+import tempfile
+import time
+import wave
+from datetime import datetime, timezone
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_RATE = 16000
+# Best quality first; --perf recommends the first one that keeps up.
+MODEL_QUALITY_ORDER = ["large-v3", "large-v2", "distil-large-v3", "large-v3-turbo", "medium", "small", "base", "tiny"]
 
 def ok(msg):
     print(f"[ OK ] {msg}")
@@ -63,7 +86,232 @@ def check_faster_whisper():
         fail(f"faster-whisper import: {e}")
         return False
 
+# --- --perf ---
+def synth_clip(path, seconds):
+    """Speech-like mono 16 kHz WAV: voiced syllables in phrases with pauses.
+    Real speech (--clip) gives more representative decoder timings."""
+    import random
+    rnd = random.Random(0)
+    out = [0.0] * int(seconds * SAMPLE_RATE)
+    pos = 0
+    while pos < len(out):
+        for _ in range(rnd.randint(3, 11)):
+            n = int(rnd.uniform(0.08, 0.3) * SAMPLE_RATE)
+            f0 = rnd.uniform(100, 220)
+            for i in range(min(n, len(out) - pos)):
+                t = i / SAMPLE_RATE
+                env = math.sin(math.pi * i / n)
+                out[pos + i] = 0.3 * env * sum(math.sin(2 * math.pi * h * f0 * t) / h for h in range(1, 6))
+            pos += n + int(rnd.uniform(0.02, 0.1) * SAMPLE_RATE)
+            if pos >= len(out):
+                break
+        pos += int(rnd.uniform(0.3, 2.0) * SAMPLE_RATE)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(b"".join(int(max(-1.0, min(1.0, x)) * 32767).to_bytes(2, "little", signed=True) for x in out))
+    return path
+
+
+def clip_seconds(path):
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except Exception:
+        out = subprocess.check_output(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                                       "-of", "default=nw=1:nk=1", path], text=True)
+        return float(out.strip())
+
+
+def perf_ffmpeg(clip, seconds, tmp):
+    """Decode an AAC copy of the clip to 16 kHz mono PCM, the worker's audio path."""
+    print("\n=== ffmpeg decode ===")
+    try:
+        m4a = os.path.join(tmp, "clip.m4a")
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", clip, "-c:a", "aac", "-b:a", "128k", m4a],
+                       check=True, capture_output=True)
+        t0 = time.perf_counter()
+        subprocess.run(["ffmpeg", "-v", "error", "-i", m4a, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+                       check=True, capture_output=True)
+        took = time.perf_counter() - t0
+    except Exception as e:
+        fail(f"ffmpeg decode: {e}")
+        return None
+    speed = seconds / took
+    ok(f"decode {seconds:.0f}s of audio in {took:.2f}s ({speed:.0f}x realtime)")
+    return {"seconds": round(took, 3), "x_realtime": round(speed, 1)}
+
+
+def perf_whisper(clip, seconds, models, computes, threads, download):
+    print("\n=== faster-whisper RTF ===")
+    try:
+        from faster_whisper import WhisperModel, decode_audio
+    except Exception as e:
+        fail(f"faster-whisper import: {e}")
+        return []
+    audio = decode_audio(clip, sampling_rate=SAMPLE_RATE)
+    device = os.environ.get("FW_DEVICE", "cpu")
+    results = []
+    for model_name in models:
+        for compute in computes:
+            for n in threads:
+                try:
+                    model = WhisperModel(model_name, device=device, compute_type=compute, cpu_threads=n,
+                                         local_files_only=not download)
+                except Exception as e:
+                    warn(f"{model_name}/{compute}: not available ({str(e).splitlines()[0][:80]}); "
+                         "use --download to fetch it")
+                    break
+                t0 = time.perf_counter()
+                # Same decode options as the worker (main.py), so the RTF matches production.
+                segments, _ = model.transcribe(audio, language="en", vad_filter=True, word_timestamps=True)
+                for _ in segments:
+                    pass
+                took = time.perf_counter() - t0
+                rtf = took / seconds
+                results.append({"model": model_name, "compute_type": compute, "threads": n, "rtf": round(rtf, 4)})
+                ok(f"{model_name:>16} {compute:>8} threads={n:<3} RTF {rtf:.3f}")
+                del model
+    return results
+
+
+def perf_argos(n_sentences):
+    print("\n=== Argos Translate ===")
+    try:
+        from argostranslate import package, translate
+    except Exception as e:
+        fail(f"argostranslate import: {e}")
+        return None
+    pairs = [(p.from_code, p.to_code) for p in package.get_installed_packages()]
+    if not pairs:
+        warn("no Argos language packages installed")
+        return None
+    src, dst = ("en", "ja") if ("en", "ja") in pairs else pairs[0]
+    translator = translate.get_translation_from_codes(src, dst)
+    sentences = [f"This is test sentence number {i} about learning languages with subtitles." for i in range(n_sentences)]
+    t0 = time.perf_counter()
+    translator.translate(sentences[0])  # model load
+    load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for s in sentences:
+        translator.translate(s)
+    took = time.perf_counter() - t0
+    rate = n_sentences / took
+    ok(f"{src}->{dst}: {rate:.1f} sentences/s (first call {load:.2f}s)")
+    return {"pair": f"{src}-{dst}", "sentences_per_sec": round(rate, 2), "load_seconds": round(load, 2)}
+
+
+def perf_rest(rounds):
+    print("\n=== REST latency ===")
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        warn("SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY not set; skipped")
+        return None
+    import requests
+    s = requests.Session()
+    s.headers.update({"apikey": key, "Authorization": f"Bearer {key}"})
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        try:
+            s.get(f"{url}/rest/v1/subtitle_jobs", params={"select": "id", "limit": "1"}, timeout=15).raise_for_status()
+        except Exception as e:
+            fail(f"REST: {e}")
+            return None
+        times.append((time.perf_counter() - t0) * 1000)
+    med = statistics.median(times[1:] or times)  # first request includes connection setup
+    ok(f"median {med:.0f} ms over {rounds} requests (first {times[0]:.0f} ms)")
+    return {"median_ms": round(med, 1), "first_ms": round(times[0], 1)}
+
+
+def recommend(stt, rest, cpus, target_rtf):
+    """Pick the best model that keeps a single job under target_rtf, and the
+    thread count giving the highest node throughput for it."""
+    env = {}
+    best = None
+    for model_name in MODEL_QUALITY_ORDER + sorted({r["model"] for r in stt} - set(MODEL_QUALITY_ORDER)):
+        runs = [r for r in stt if r["model"] == model_name and r["rtf"] <= target_rtf]
+        if runs:
+            # Audio seconds processed per wall second with cpus // threads jobs in parallel.
+            best = max(runs, key=lambda r: max(1, cpus // r["threads"]) / r["rtf"])
+            break
+    if best:
+        parallel = max(1, cpus // best["threads"])
+        env.update(FW_MODEL=best["model"], FW_COMPUTE_TYPE=best["compute_type"], FW_CPU_THREADS=best["threads"],
+                   STT_CONCURRENCY=parallel, WORKER_CONCURRENCY=parallel, PIPELINE_MAX_JOBS=parallel * 2,
+                   IO_CONCURRENCY=max(2, parallel * 2))
+    elif stt:
+        warn(f"no measured model reaches RTF <= {target_rtf}; keeping the current FW_MODEL")
+    # Tier RTFs at the recommended thread count, where measured.
+    rtf_by_model = {}
+    for r in sorted(stt, key=lambda r: (r["threads"] != env.get("FW_CPU_THREADS"), r["rtf"]), reverse=True):
+        rtf_by_model[r["model"]] = r["rtf"]
+    if rtf_by_model:
+        env["STT_TIER_RTF"] = ",".join(f"{m}={v}" for m, v in rtf_by_model.items())
+    if rest:
+        # Slow round trips are hidden by more parallel write chunks.
+        env["WRITE_MAX_INFLIGHT"] = 2 if rest["median_ms"] < 50 else 4 if rest["median_ms"] < 200 else 8
+    return env
+
+
+def write_env(path, env, report):
+    lines = [f"# Written by tools/diagnose.py --perf on {datetime.now(timezone.utc).isoformat(timespec='seconds')}",
+             "# Loaded by main.py at startup; variables already set in the environment take precedence.",
+             f"# Measurements: {json.dumps(report, ensure_ascii=False)}"]
+    lines += [f"{k}={v}" for k, v in env.items()]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run_perf(args):
+    cpus = os.cpu_count() or 1
+    models = [m.strip() for m in (args.models or os.environ.get("FW_MODEL", "tiny,base,small")).split(",") if m.strip()]
+    computes = [c.strip() for c in args.compute.split(",") if c.strip()]
+    threads = sorted({int(t) for t in args.threads.split(",")} if args.threads
+                     else {max(1, cpus // 4), max(1, cpus // 2), cpus})
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = args.clip or synth_clip(os.path.join(tmp, "clip.wav"), args.seconds)
+        if not args.clip:
+            warn("no --clip given: using synthesized speech-like audio; a real speech clip gives more accurate RTF")
+        seconds = clip_seconds(clip)
+        report = {"cpus": cpus, "clip_seconds": round(seconds, 1)}
+        report["ffmpeg"] = perf_ffmpeg(clip, seconds, tmp)
+        report["stt"] = perf_whisper(clip, seconds, models, computes, threads, args.download)
+    report["argos"] = perf_argos(args.sentences)
+    report["rest"] = perf_rest(args.rest_rounds)
+    env = recommend(report["stt"], report["rest"], cpus, args.target_rtf)
+    print("\n=== RECOMMENDED ===")
+    for k, v in env.items():
+        print(f"{k}={v}")
+    if not env:
+        fail("nothing measured; see the messages above")
+        sys.exit(1)
+    if args.write:
+        write_env(args.write, env, report)
+        ok(f"written to {args.write}")
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Worker environment check")
+    ap.add_argument("--perf", action="store_true", help="benchmark this machine and write a recommended tuning")
+    ap.add_argument("--clip", default=None, help="speech audio for the benchmarks (default: synthesized)")
+    ap.add_argument("--seconds", type=float, default=30, help="length of the synthesized clip")
+    ap.add_argument("--models", default=None, help="comma-separated FW_MODEL values (default: FW_MODEL or tiny,base,small)")
+    ap.add_argument("--compute", default=os.environ.get("FW_COMPUTE_TYPE", "int8"), help="comma-separated compute types")
+    ap.add_argument("--threads", default=None, help="comma-separated cpu_threads values (default: cpus/4, cpus/2, cpus)")
+    ap.add_argument("--download", action="store_true", help="download models that are not cached yet")
+    ap.add_argument("--target-rtf", type=float, default=0.5, help="slowest acceptable single-job RTF")
+    ap.add_argument("--sentences", type=int, default=50)
+    ap.add_argument("--rest-rounds", type=int, default=6)
+    ap.add_argument("--write", default=os.path.join(WORKER_DIR, ".env.tuned"), help="output file ('' to skip)")
+    ap.add_argument("--json", action="store_true", help="also print the raw measurements as JSON")
+    args = ap.parse_args()
+    if args.perf:
+        run_perf(args)
+        return
     all_ok = True
     all_ok &= check_env()
     all_ok &= check_system()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Local in-memory stand-in for the PostgREST endpoints the worker uses.
+
+Run it and point the worker at it:
+
+    python tools/mock_postgrest.py --port 54321 --seed-jobs dQw4w9WgXcQ:en
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=dummy python main.py
+
+Supports the subset of PostgREST the worker relies on: GET with select /
+order / limit and column filters (eq, neq, lt, lte, gt, gte, is, in),
+Prefer: count=exact (Content-Range), conditional PATCH returning the updated rows, filtered DELETE, and POST inserts including
+upserts (on_conflict + Prefer: resolution=merge-duplicates) with gzip
+request bodies. Every request is handled under one lock, so a conditional
+PATCH behaves like an atomic UPDATE ... WHERE.
+"""
+import argparse
+import gzip
+import json
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlparse
+
+
+def _coerce(v):
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return v
+
+
+def _cmp(a, b) -> int:
+    a, b = _coerce(a), _coerce(b)
+    if type(a) is not type(b):
+        a, b = str(a), str(b)
+    return (a > b) - (a < b)
+
+
+def _match(row: Dict, col: str, expr: str) -> bool:
+    op, _, val = expr.partition(".")
+    cur = row.get(col)
+    if op == "is":
+        return cur is None if val == "null" else str(cur).lower() == val
+    if cur is None:
+        return False
+    if op == "eq":
+        return _cmp(cur, val) == 0
+    if op == "neq":
+        return _cmp(cur, val) != 0
+    if op == "lt":
+        return _cmp(cur, val) < 0
+    if op == "lte":
+        return _cmp(cur, val) <= 0
+    if op == "gt":
+        return _cmp(cur, val) > 0
+    if op == "gte":
+        return _cmp(cur, val) >= 0
+    if op == "in":
+        return any(_cmp(cur, x) == 0 for x in val.strip("()").split(","))
+    raise ValueError(f"unsupported operator: {op}")
+
+
+class MockPostgREST:
+    """In-memory tables served over HTTP under /rest/v1/<table>."""
+
+    RESERVED = {"select", "order", "limit", "offset", "on_conflict"}
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.tables: Dict[str, List[Dict]] = {}
+        # (table, conflict columns) -> {key: row}, kept up to date by inserts.
+        self._indexes: Dict = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockPostgREST":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def seed_job(self, video_id: str, lang: str) -> Dict:
+        row = {
+            "id": str(uuid.uuid4()),
+            "video_id": video_id,
+            "lang": lang,
+            "status": "queued",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self.lock:
+            self.tables.setdefault("subtitle_jobs", []).append(row)
+            self._drop_indexes("subtitle_jobs")
+        return row
+
+    # --- request handling ---
+    def _filter(self, table: str, params: List) -> List[Dict]:
+        rows = self.tables.get(table, [])
+        for col, expr in params:
+            if col in self.RESERVED:
+                continue
+            rows = [r for r in rows if _match(r, col, expr)]
+        return rows
+
+    def handle(self, method: str, path: str, query: str, headers, body: bytes):
+        """Returns (status, payload or None, extra response headers)."""
+        table = path.rsplit("/", 1)[-1]
+        params = parse_qsl(query, keep_blank_values=True)
+        opts = dict(params)
+        prefer = headers.get("Prefer", "")
+        raw_len = len(body)
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += raw_len
+            if method == "GET":
+                rows = list(self._filter(table, params))
+                total = len(rows)
+                if "order" in opts:
+                    col, _, direction = opts["order"].partition(".")
+                    rows.sort(key=lambda r: _coerce(r.get(col)), reverse=direction == "desc")
+                offset = int(opts.get("offset", 0))
+                rows = rows[offset:]
+                if "limit" in opts:
+                    rows = rows[: int(opts["limit"])]
+                if opts.get("select", "*") != "*":
+                    cols = opts["select"].split(",")
+                    rows = [{c: r.get(c) for c in cols} for r in rows]
+                extra = {}
+                if "count=exact" in prefer:
+                    span = f"{offset}-{offset + len(rows) - 1}" if rows else "*"
+                    extra["Content-Range"] = f"{span}/{total}"
+                return 200, rows, extra
+            if method == "DELETE":
+                doomed = {id(r) for r in self._filter(table, params)}
+                self.tables[table] = [r for r in self.tables.get(table, []) if id(r) not in doomed]
+                self._drop_indexes(table)
+                return 204, None, {}
+            data = json.loads(body or b"null")
+            if method == "PATCH":
+                rows = self._filter(table, params)
+                for r in rows:
+                    r.update(data)
+                self._drop_indexes(table)
+                return self._written(prefer, [dict(r) for r in rows])
+            if method == "POST":
+                new_rows = data if isinstance(data, list) else [data]
+                stored = self.tables.setdefault(table, [])
+                keys = opts["on_conflict"].split(",") if "on_conflict" in opts else None
+                self._drop_indexes(table, keep=tuple(keys) if keys else None)
+                index = self._index(table, tuple(keys)) if keys else {}
+                for r in new_rows:
+                    if keys:
+                        k = tuple(_coerce(r.get(c)) for c in keys)
+                        if k in index:
+                            if "resolution=merge-duplicates" not in prefer:
+                                return 409, {"message": "duplicate key value violates unique constraint"}, {}
+                            index[k].update(r)
+                            continue
+                    r = dict(r)
+                    r.setdefault("id", str(uuid.uuid4()))
+                    stored.append(r)
+                    if keys:
+                        index[tuple(_coerce(r.get(c)) for c in keys)] = r
+                return self._written(prefer, new_rows, created=True)
+        return 405, {"message": f"unsupported method {method}"}, {}
+
+    def _index(self, table: str, keys: tuple) -> Dict:
+        index = self._indexes.get((table, keys))
+        if index is None:
+            index = {tuple(_coerce(r.get(k)) for k in keys): r for r in self.tables.get(table, [])}
+            self._indexes[(table, keys)] = index
+        return index
+
+    def _drop_indexes(self, table: str, keep: tuple = None) -> None:
+        for k in [k for k in self._indexes if k[0] == table and k[1] != keep]:
+            del self._indexes[k]
+
+    @staticmethod
+    def _written(prefer: str, rows: List[Dict], created: bool = False):
+        if "return=representation" in prefer:
+            return (201 if created else 200), rows, {}
+        return (201 if created else 204), None, {}
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self):
+                u = urlparse(self.path)
+                if not u.path.startswith("/rest/v1/"):
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+                try:
+                    status, payload, extra = mock.handle(self.command, u.path, u.query, self.headers, body)
+                except Exception as e:
+                    status, payload, extra = 400, {"message": str(e)}, {}
+                out = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for k, v in extra.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = do_PATCH = do_POST = do_DELETE = _dispatch
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=54321)
+    ap.add_argument("--seed-jobs", nargs="*", default=[], metavar="VIDEO_ID:LANG",
+                    help="queued subtitle_jobs rows to create at startup")
+    args = ap.parse_args()
+    mock = MockPostgREST(args.host, args.port)
+    for spec in args.seed_jobs:
+        video_id, _, lang = spec.partition(":")
+        mock.seed_job(video_id, lang or "en")
+    print(f"Mock PostgREST listening on {mock.url}/rest/v1 ({len(args.seed_jobs)} job(s) queued)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        json.dump(mock.tables, sys.stdout, indent=1, default=str)
+        print()
+
+
+if __name__ == "__main__":
+    main()